@@ -2,6 +2,8 @@
 Builds a PDF from a JSON configuration file that points to various Markdown source files.
 
 usage: libris <configuration_file>
+       libris shard <configuration_file> --index <i> --count <n> --directory <shared_directory>
+       libris merge <configuration_file> --directory <shared_directory>
 
 Where <configuration_file> is a JSON file that specifies how to build the PDF. View the full docs
 for details.
@@ -9,32 +11,112 @@ for details.
 import argparse
 import os
 import sys
+from typing import Union
 import jsonschema
 from .lib.constants import JSON_SCHEMA_PATH
-from .lib.data_extractors import get_json_data
+from .lib.data_extractors import get_json_data, get_markdown_file_list, get_markdown_from_file
+from .lib.dependencies import DependencyGraph
+from .lib.markdown_engines import (
+    DEFAULT_MARKDOWN_ENGINE, MARKDOWN_ENGINES, get_engine_differences
+)
 from .lib.pdf_builder import build_pdf
+from .lib.preview import PreviewCache, build_preview
+from .lib.sharding import build_shard, merge_shards
 from .lib.watch import watch
 
-def main(config_file_path: str, should_watch: bool, be_verbose: bool, skip_validation: bool):
+def main(arguments: argparse.Namespace):
     """
     Builds a PDF from a JSON configuration file that points to various Markdown source files.
     Optionally watches for changes.
 
     Args:
-        config_file (str): The configuration file to be used.
-        should_watch (bool): Whether to watch the source files for changes and re-compile.
+        arguments (argparse.Namespace): Parsed command line arguments for a plain build, from
+            handle_args.
+    """
+    config = get_config_or_terminate(arguments.config_file, arguments.no_validation)
+    if arguments.compare_engine is not None:
+        sys.exit(1 if compare_markdown_engines(config, arguments.compare_engine) else 0)
+    preview_cache = PreviewCache() if arguments.preview else None
+    try:
+        dependencies = build_once(config, arguments.verbose, arguments.force, preview_cache)
+    except ValueError as err:
+        terminate_with_error(err)
+    if arguments.watch:
+        watch(arguments.config_file, arguments.verbose, dependencies, preview_cache)
+
+def build_once(
+        config: dict,
+        be_verbose: bool,
+        force: bool,
+        preview_cache: Union[PreviewCache, None]
+    ) -> DependencyGraph:
+    """
+    Builds the PDF, or the HTML preview when given a preview cache.
+
+    Args:
+        config (dict): The validated configuration object.
         be_verbose (bool): Whether to print debugging information.
+        force (bool): Whether to build even if the build manifest shows nothing has changed.
+        preview_cache (Union[PreviewCache, None]): Cache for HTML previews, or None to build a PDF.
+
+    Returns:
+        DependencyGraph: Every file read during the build.
+    """
+    if preview_cache is None:
+        return build_pdf(config, be_verbose, force)
+    return build_preview(config, be_verbose, preview_cache)
+
+def shard_main(arguments: argparse.Namespace):
+    """
+    Renders one shard of a sharded build to the shared directory.
+
+    Args:
+        arguments (argparse.Namespace): Parsed command line arguments for the shard command, from
+            handle_shard_args.
+    """
+    config = get_config_or_terminate(arguments.config_file, arguments.no_validation)
+    try:
+        build_shard(
+            config,
+            arguments.index,
+            arguments.count,
+            arguments.directory,
+            arguments.verbose
+        )
+    except ValueError as err:
+        terminate_with_error(err)
+
+def merge_main(arguments: argparse.Namespace):
+    """
+    Merges the artifacts of every shard in the shared directory into the final PDFs.
+
+    Args:
+        arguments (argparse.Namespace): Parsed command line arguments for the merge command, from
+            handle_merge_args.
+    """
+    config = get_config_or_terminate(arguments.config_file, arguments.no_validation)
+    try:
+        merge_shards(config, arguments.directory)
+    except ValueError as err:
+        terminate_with_error(err)
+
+def get_config_or_terminate(config_file_path: str, skip_validation: bool) -> dict:
+    """
+    Retrieves and validates the configuration file, terminating the application if it is not
+    valid.
+
+    Args:
+        config_file_path (str): Path to the configuration file.
         skip_validation (bool): Whether to skip JSON validation.
+
+    Returns:
+        dict: The validated configuration object.
     """
     try:
         config = get_config_and_validate(config_file_path, skip_validation)
     except jsonschema.exceptions.ValidationError as err:
         terminate_with_validation_error(err)
-    if should_watch:
-        build_pdf(config, be_verbose)
-        watch(config_file_path, be_verbose)
-    else:
-        build_pdf(config, be_verbose)
+    return config
 
 def get_config_and_validate(config_file_path: str, skip_validation: bool) -> dict:
     """
@@ -49,11 +131,82 @@ def get_config_and_validate(config_file_path: str, skip_validation: bool) -> dic
     """
     config = get_json_data(config_file_path)
     dir_path = os.path.dirname(os.path.realpath(__file__))
-    schema = get_json_data(os.path.join(dir_path, JSON_SCHEMA_PATH))
+    schema_path = os.path.join(dir_path, JSON_SCHEMA_PATH)
+    schema = get_json_data(schema_path)
     if not skip_validation:
-        jsonschema.validate(config, schema)
+        resolver = get_schema_resolver(schema, os.path.dirname(schema_path))
+        jsonschema.validate(config, schema, resolver=resolver)
     return config
 
+def get_schema_resolver(schema: dict, schema_directory: str) -> jsonschema.RefResolver:
+    """
+    Builds a reference resolver that resolves the schemas bundled with libris locally, so that
+    validation uses the sub-schemas matching this version instead of the published ones.
+
+    Args:
+        schema (dict): The configuration schema.
+        schema_directory (str): Directory containing the bundled schemas.
+
+    Returns:
+        jsonschema.RefResolver: Resolver preloaded with every bundled schema, keyed by its $id.
+    """
+    store = {}
+    for file_entry in sorted(os.listdir(schema_directory)):
+        if file_entry.endswith('.json'):
+            bundled_schema = get_json_data(os.path.join(schema_directory, file_entry))
+            store[bundled_schema['$id']] = bundled_schema
+    return jsonschema.RefResolver.from_schema(schema, store=store)
+
+def compare_markdown_engines(config: dict, engine_name: str) -> bool:
+    """
+    Converts every markdown source file with both the configured engine and the given engine and
+    prints where the resulting HTML differs.
+
+    Args:
+        config (dict): The validated configuration object.
+        engine_name (str): Name of the engine to compare against the configured engine.
+
+    Returns:
+        bool: Whether any differences were found.
+    """
+    base_engine_name = config.get('markdownEngine', DEFAULT_MARKDOWN_ENGINE)
+    has_differences = False
+    for item in config['sources']:
+        for filename in get_markdown_file_list(item):
+            differences = get_file_differences(
+                filename,
+                config.get('markdownPipe', None),
+                base_engine_name,
+                engine_name
+            )
+            if differences:
+                has_differences = True
+                print('\n'.join(differences))
+    if not has_differences:
+        print(f'No differences found between {base_engine_name} and {engine_name}.')
+    return has_differences
+
+def get_file_differences(
+        filename: str,
+        markdown_pipe: Union[str, None],
+        base_engine_name: str,
+        engine_name: str
+    ) -> list:
+    """
+    Converts one markdown source file with two engines and lists where the HTML differs.
+
+    Args:
+        filename (str): Path of the markdown file.
+        markdown_pipe (Union[str, None]): Pipe command, or None if no pipe.
+        base_engine_name (str): Name of the configured engine.
+        engine_name (str): Name of the engine to compare against.
+
+    Returns:
+        list: Unified diff lines. An empty list means the outputs match.
+    """
+    text = get_markdown_from_file(filename, markdown_pipe)
+    return get_engine_differences(text, base_engine_name, engine_name, filename)
+
 def terminate_with_validation_error(err: jsonschema.exceptions.ValidationError):
     """
     Terminates the application with a validation error.
@@ -65,13 +218,42 @@ def terminate_with_validation_error(err: jsonschema.exceptions.ValidationError):
     print('Error: config file format is not valid!')
     sys.exit(1)
 
-def handle_args() -> str:
+def terminate_with_error(err: Exception):
     """
-    Builds an argument parser for the application
+    Terminates the application with an error message.
+
+    Args:
+        err (Exception): The error thrown.
+    """
+    print(f'Error: {err}')
+    sys.exit(1)
+
+def run(arguments: argparse.Namespace):
+    """
+    Runs the command selected on the command line.
+
+    Args:
+        arguments (argparse.Namespace): Parsed command line arguments from handle_args.
+    """
+    if arguments.command == 'shard':
+        shard_main(arguments)
+    elif arguments.command == 'merge':
+        merge_main(arguments)
+    else:
+        main(arguments)
+
+def handle_args() -> argparse.Namespace:
+    """
+    Builds an argument parser for the application. The shard and merge commands are selected by
+    their name as the first argument, so that plain builds keep their original usage.
 
     Returns:
-        str: The configuration file to be used for constructing the PDF.
+        argparse.Namespace: Parsed arguments, with the selected command under 'command'.
     """
+    if len(sys.argv) > 1 and sys.argv[1] == 'shard':
+        return handle_shard_args(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'merge':
+        return handle_merge_args(sys.argv[2:])
     parser = argparse.ArgumentParser(
         prog='libris',
         description='Builds a PDF from a JSON configuration file that points to various Markdown'\
@@ -100,8 +282,124 @@ def handle_args() -> str:
         action='store_true',
         help='Skips JSON validation up-front. Use if you are getting URL resolution errors.'
     )
-    return parser.parse_args()
+    add_build_mode_args(parser)
+    arguments = parser.parse_args()
+    arguments.command = 'build'
+    return arguments
+
+def add_build_mode_args(parser: argparse.ArgumentParser):
+    """
+    Adds the arguments that change what a plain build does.
+
+    Args:
+        parser (argparse.ArgumentParser): Parser to which to add arguments.
+    """
+    parser.add_argument(
+        '-c',
+        '--compare-engine',
+        type=str,
+        choices=list(MARKDOWN_ENGINES),
+        metavar='ENGINE',
+        help='Prints differences between the configured markdown engine and the given engine'\
+        f' ({", ".join(MARKDOWN_ENGINES)}) for each source file instead of building.'
+    )
+    parser.add_argument(
+        '-p',
+        '--preview',
+        action='store_true',
+        help='Writes an HTML preview of each source next to the output instead of a PDF. Can be'\
+        ' combined with --watch.'
+    )
+    parser.add_argument(
+        '-f',
+        '--force',
+        action='store_true',
+        help='Builds even if the build manifest shows that no inputs have changed.'
+    )
+
+def handle_shard_args(args: list) -> argparse.Namespace:
+    """
+    Builds an argument parser for the shard command.
+
+    Args:
+        args (list): Command line arguments following the command name.
+
+    Returns:
+        argparse.Namespace: Parsed arguments, with the selected command under 'command'.
+    """
+    parser = argparse.ArgumentParser(
+        prog='libris shard',
+        description='Renders a deterministic subset of the sources to a shared directory for a'\
+        ' later merge. Source n is rendered by shard n % count.'
+    )
+    add_shared_directory_args(parser)
+    parser.add_argument(
+        '--index',
+        type=int,
+        required=True,
+        help='Index of this shard, from 0 to count - 1.'
+    )
+    parser.add_argument(
+        '--count',
+        type=int,
+        required=True,
+        help='Total number of shards.'
+    )
+    parser.add_argument(
+        '-v',
+        '--verbose',
+        action='store_true',
+        help='Prints additional logging data, including intermediate HTML.'
+    )
+    arguments = parser.parse_args(args)
+    arguments.command = 'shard'
+    return arguments
+
+def handle_merge_args(args: list) -> argparse.Namespace:
+    """
+    Builds an argument parser for the merge command.
+
+    Args:
+        args (list): Command line arguments following the command name.
+
+    Returns:
+        argparse.Namespace: Parsed arguments, with the selected command under 'command'.
+    """
+    parser = argparse.ArgumentParser(
+        prog='libris merge',
+        description='Combines the artifacts of every shard in a shared directory into the final'\
+        ' PDFs.'
+    )
+    add_shared_directory_args(parser)
+    arguments = parser.parse_args(args)
+    arguments.command = 'merge'
+    return arguments
+
+def add_shared_directory_args(parser: argparse.ArgumentParser):
+    """
+    Adds the arguments shared by the shard and merge commands.
+
+    Args:
+        parser (argparse.ArgumentParser): Parser to which to add arguments.
+    """
+    parser.add_argument(
+        'config_file',
+        type=str,
+        help='A JSON file that specifies how to build the PDF. View the full docs for details.'
+    )
+    parser.add_argument(
+        '-d',
+        '--directory',
+        type=str,
+        required=True,
+        help='Shared directory for shard artifacts.'
+    )
+    parser.add_argument(
+        '-n',
+        '--no-validation',
+        action='store_true',
+        help='Skips JSON validation up-front. Use if you are getting URL resolution errors.'
+    )
 
 if __name__ == '__main__':
-    arguments = handle_args()
-    main(arguments.config_file, arguments.watch, arguments.verbose, arguments.no_validation)
+    run(handle_args())
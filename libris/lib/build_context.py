@@ -0,0 +1,52 @@
+"""
+Build context for libris.
+"""
+from typing import Callable
+from weasyprint import CSS
+from .dependencies import DependencyGraph
+
+class BuildContext:
+    """
+    Holds the state shared by every variant and section of one build, shard or merge: the files
+    read, the CSS objects already parsed, and the sections already laid out.
+    """
+    def __init__(self, be_verbose: bool = False):
+        self.dependencies = DependencyGraph()
+        self.be_verbose = be_verbose
+        self.css_cache = {}
+        self.layout_cache = {}
+
+    def get_css_object(self, filename: str) -> CSS:
+        """
+        Creates a Weasyprint CSS object from a file, recording the file and anything it imports.
+        Each file is only parsed once per build.
+
+        Args:
+            filename (str): Path to the CSS file.
+
+        Returns:
+            CSS: Weasyprint CSS object.
+        """
+        if filename not in self.css_cache:
+            self.dependencies.add_file(filename)
+            self.css_cache[filename] = CSS(
+                filename=filename,
+                url_fetcher=self.dependencies.url_fetcher
+            )
+        return self.css_cache[filename]
+
+    def get_layout(self, layout_key: tuple, create: Callable[[], any]) -> any:
+        """
+        Gets the layout of a section, laying it out once per build. Variants whose sections
+        resolve to the same stylesheets share the layout.
+
+        Args:
+            layout_key (tuple): Key identifying a section and stylesheet set, from get_layout_key.
+            create (Callable[[], any]): Function that lays out the section.
+
+        Returns:
+            any: Layout returned by create.
+        """
+        if layout_key not in self.layout_cache:
+            self.layout_cache[layout_key] = create()
+        return self.layout_cache[layout_key]
@@ -2,3 +2,5 @@
 Constants module for libris.
 """
 JSON_SCHEMA_PATH = 'json-schemas/config-schema.json'
+# The package version. setup.py reads it from here, so it is only set in one place.
+LIBRIS_VERSION = '1.4.0'
@@ -1,13 +1,16 @@
 """
 Configuration data extraction functions for libris.
 """
+import hashlib
 import json
 import os
 import subprocess
-from typing import Union
-from bs4 import BeautifulSoup
-from markdown2 import markdown
-from weasyprint import HTML, CSS
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Union
+from weasyprint import HTML
+from .build_context import BuildContext
+from .dependencies import DependencyGraph
+from .splitting import get_cross_chunk_references, split_markdown
 
 def get_json_data(json_file_path: str) -> dict:
     """
@@ -24,6 +27,52 @@ def get_json_data(json_file_path: str) -> dict:
         json_object = json.loads(json_string)
         return json_object
 
+def get_config_hash(config: dict) -> str:
+    """
+    Hashes a configuration object. Must be called before the build adds parsed data to it.
+
+    Args:
+        config (dict): Configuration data.
+
+    Returns:
+        str: Hexadecimal SHA-256 hash.
+    """
+    config_string = json.dumps(config, sort_keys=True)
+    return hashlib.sha256(config_string.encode('utf-8')).hexdigest()
+
+def get_variants(config: dict) -> list:
+    """
+    Retrieves the output variants to build from the configuration. Without a variants property,
+    the top level output and defaultStyle properties form a single variant.
+
+    Args:
+        config (dict): The configuration object.
+
+    Returns:
+        list: List of dictionaries with 'name', 'output', 'defaultStyle' and 'styles' keys. Each
+            variant's styles are the top level styles updated with its own style overrides.
+    """
+    styles = config.get('styles', {})
+    default_style_key = config.get('defaultStyle')
+    if 'variants' not in config:
+        return [{
+            'name': None,
+            'output': config['output'],
+            'defaultStyle': default_style_key,
+            'styles': styles
+        }]
+    output = []
+    for name, variant in config['variants'].items():
+        variant_styles = dict(styles)
+        variant_styles.update(variant.get('styles', {}))
+        output.append({
+            'name': name,
+            'output': variant['output'],
+            'defaultStyle': variant.get('defaultStyle', default_style_key),
+            'styles': variant_styles
+        })
+    return output
+
 def get_default_style(default_style_key: str, css_data: dict) -> Union[list, None]:
     """
     Retrieves the default style from the CSS list.
@@ -42,174 +91,258 @@ def get_default_style(default_style_key: str, css_data: dict) -> Union[list, Non
 
 def get_html_data(
         sources: list,
-        document_wrapper_class: str,
+        process_html: Callable[[str], str],
         markdown_pipe: Union[str, None],
-        be_verbose: bool
+        convert_markdown: Callable[[str], str],
+        context: BuildContext
     ) -> list:
     """
     Retrieves Weasyprint HTML objects based on a list of Markdown sources
 
     Args:
         sources (list): List of source Markdown sources to use
-        document_wrapper_class (str): Optional class in which to wrap resulting document.
+        process_html (Callable[[str], str]): HTML post-processing function, from
+            get_html_processor.
         markdown_pipe (str): Transformative command to run. HTML will be passed to command as
             stdin and the command's stdout output will be used instead of the raw HTML.
-        be_verbose (bool): Whether to print additional debugging information.
+        convert_markdown (Callable[[str], str]): Markdown engine function used to convert
+            Markdown to HTML.
+        context (BuildContext): Build in which to record files read, and whose be_verbose
+            setting prints the processed HTML.
 
     Returns:
         list: List of dictionaries containing original configuration plus Weasyprint HTML objects.
     """
     output = []
     for item in sources:
-        item_output = get_output_from_source(item, document_wrapper_class, markdown_pipe, be_verbose)
+        item_output = get_output_from_source(
+            item,
+            process_html,
+            markdown_pipe,
+            convert_markdown,
+            context
+        )
         output.append(item_output)
     return output
 
 def get_output_from_source(
         item: Union[dict, str],
-        document_wrapper_class: str,
+        process_html: Callable[[str], str],
         markdown_pipe: Union[str, None],
-        be_verbose: bool
+        convert_markdown: Callable[[str], str],
+        context: BuildContext
     ) -> dict:
     """
     Gets a source configuration dictionary from a source dictionary or string.
 
     Args:
         item (Union[dict, str]): Source configuration dictionary or string
-        document_wrapper_class (str): Optional div class with which to wrap HTML.
-        be_verbose (bool): Whether to print additional debugging information.
+        process_html (Callable[[str], str]): HTML post-processing function.
+        convert_markdown (Callable[[str], str]): Markdown engine function.
+        context (BuildContext): Build in which to record files read, and whose be_verbose
+            setting prints the processed HTML.
 
     Returns:
         dict: Configuration dictionary with parsed HTML.
     """
-    html, item_output = get_html_from_source(item, markdown_pipe)
-    if document_wrapper_class:
-        html = wrap_with_tag(html, document_wrapper_class)
-    if be_verbose:
-        print(html)
-    html_object = HTML(string=html, base_url='.')
-    item_output['html'] = html_object
+    add_source_dependencies(item, context.dependencies)
+    if isinstance(item, dict) and 'split' in item:
+        return get_split_output_from_source(
+            item,
+            process_html,
+            markdown_pipe,
+            convert_markdown,
+            context
+        )
+    html, item_output = get_html_from_source(item, markdown_pipe, convert_markdown)
+    item_output['html'] = get_html_object(html, process_html, context)
     return item_output
 
+def get_split_output_from_source(
+        item: dict,
+        process_html: Callable[[str], str],
+        markdown_pipe: Union[str, None],
+        convert_markdown: Callable[[str], str],
+        context: BuildContext
+    ) -> dict:
+    """
+    Gets a source configuration dictionary for a source with a split setting. The collated
+    markdown is split into chunks, which are converted in parallel worker processes. The chunks
+    are kept as HTML strings, because they are laid out in worker processes as well.
+
+    Args:
+        item (dict): Source configuration dictionary.
+        process_html (Callable[[str], str]): HTML post-processing function.
+        convert_markdown (Callable[[str], str]): Markdown engine function.
+        context (BuildContext): Build in which to record files read, and whose be_verbose
+            setting prints the processed HTML.
+
+    Returns:
+        dict: Configuration dictionary with a list of HTML chunk strings under 'htmlChunks', or
+            with a parsed HTML object under 'html' if the source did not split.
+    """
+    markdown_text = get_markdown_from_source(item, markdown_pipe)
+    chunks = split_markdown(
+        markdown_text,
+        item['split'].get('headingLevel'),
+        item['split'].get('marker')
+    )
+    if len(chunks) == 1:
+        html = convert_markdown(chunks[0])
+        item['html'] = get_html_object(html, process_html, context)
+        return item
+    item['htmlChunks'] = []
+    for html in convert_markdown_chunks(chunks, convert_markdown):
+        html = process_html(html)
+        if context.be_verbose:
+            print(html)
+        item['htmlChunks'].append(html)
+    return item
+
+def convert_markdown_chunks(chunks: list, convert_markdown: Callable[[str], str]) -> list:
+    """
+    Converts the chunks of a split source in parallel worker processes. Prints a warning for
+    reference-style links whose definitions ended up in a different chunk.
+
+    Args:
+        chunks (list): Markdown chunks returned by split_markdown.
+        convert_markdown (Callable[[str], str]): Markdown engine function.
+
+    Returns:
+        list: HTML of each chunk, in order.
+    """
+    cross_chunk_references = get_cross_chunk_references(chunks)
+    if cross_chunk_references:
+        print(
+            f'Warning: links to {", ".join(cross_chunk_references)} are defined in a different'\
+            ' split chunk and will not be linked. Move the definitions next to their links.'
+        )
+    with ProcessPoolExecutor() as executor:
+        return list(executor.map(convert_markdown, chunks))
+
+def get_html_object(
+        html: str,
+        process_html: Callable[[str], str],
+        context: BuildContext
+    ) -> HTML:
+    """
+    Creates a Weasyprint HTML object from converted markdown.
+
+    Args:
+        html (str): HTML converted from markdown.
+        process_html (Callable[[str], str]): HTML post-processing function.
+        context (BuildContext): Build in which to record files read, and whose be_verbose
+            setting prints the processed HTML.
+
+    Returns:
+        HTML: Weasyprint HTML object.
+    """
+    html = process_html(html)
+    if context.be_verbose:
+        print(html)
+    return HTML(string=html, base_url='.', url_fetcher=context.dependencies.url_fetcher)
+
+def add_source_dependencies(item: Union[dict, str], dependencies: DependencyGraph):
+    """
+    Records the markdown files, and any source directory, read for a source configuration.
+
+    Args:
+        item (Union[dict, str]): Source configuration dictionary or string.
+        dependencies (DependencyGraph): Graph in which to record files read.
+    """
+    if isinstance(item, dict) and 'sourceDirectory' in item:
+        dependencies.add_directory(item['sourceDirectory'])
+    for filename in get_markdown_file_list(item):
+        dependencies.add_file(filename)
+
 def get_html_from_source(
         item: Union[dict, str],
-        markdown_pipe: Union[str, None]
+        markdown_pipe: Union[str, None],
+        convert_markdown: Callable[[str], str]
     ) -> 'tuple[str, dict]':
     """
     Retrieves HTML from one or more markdown source files.
 
     Args:
         item (Union[dict, str]): Source configuration dictionary or string
+        markdown_pipe (Union[str, None]): Pipe command, or None if no pipe.
+        convert_markdown (Callable[[str], str]): Markdown engine function.
 
     Returns:
         str: HTML result from one or more markdown files.
         dict: Object for storage of the files' details for later processing.
     """
+    html = convert_markdown(get_markdown_from_source(item, markdown_pipe))
     if isinstance(item, str):
-        return get_html_from_string_source(item, markdown_pipe)
-    if 'source' in item:
-        return get_html_from_dict_with_source(item, markdown_pipe)
-    if 'sources' in item:
-        return get_html_from_dict_with_sources(item, markdown_pipe)
-    return get_html_from_dict_with_source_directory(item, markdown_pipe)
+        return html, {}
+    return html, item
 
-def get_html_from_string_source(item: str, markdown_pipe: Union[str, None]) -> 'tuple[str, dict]':
+def get_markdown_from_source(item: Union[dict, str], markdown_pipe: Union[str, None]) -> str:
     """
-    Retrieves HTML from a markdown source file.
+    Retrieves the collated markdown of one or more markdown source files.
 
     Args:
-        item (str): Source configuration string.
+        item (Union[dict, str]): Source configuration dictionary or string.
+        markdown_pipe (Union[str, None]): Pipe command, or None if no pipe.
 
     Returns:
-        str: HTML result from the markdown file.
-        dict: Object for storage of the file's details for later processing.
+        str: Markdown of all source files, piped and joined by blank lines.
     """
-    with open(item, 'r') as markdown_file:
-        text = markdown_file.read()
-        text = apply_pipe(text, markdown_pipe)
-        html = markdown(text, extras=['fenced-code-blocks', 'markdown-in-html', 'tables'])
-        return html, {}
+    texts = []
+    for filename in get_markdown_file_list(item):
+        texts.append(get_markdown_from_file(filename, markdown_pipe))
+    return join_markdown(texts)
 
-def get_html_from_dict_with_source(
-        item: dict,
-        markdown_pipe: Union[str, None]
-    ) -> 'tuple[str, dict]':
+def join_markdown(texts: list) -> str:
     """
-    Retrieves HTML from a markdown source file.
+    Collates the piped markdown of a source's files.
 
     Args:
-        item (dict): Source configuration dictionary.
+        texts (list): Piped markdown of each file, in collation order.
 
     Returns:
-        str: HTML result from a markdown file.
-        dict: Object for storage of the file's details for later processing.
-    """
-    with open(item['source'], 'r') as markdown_file:
-        text = markdown_file.read()
-        text = apply_pipe(text, markdown_pipe)
-        html = markdown(
-            text,
-            extras=['fenced-code-blocks', 'markdown-in-html', 'tables']
-        )
-        return html, item
+        str: Markdown of all files, joined by blank lines.
+    """
+    return '\n\n'.join(texts)
 
-def get_html_from_dict_with_sources(
-        item: dict,
-        markdown_pipe: Union[str, None]
-    ) -> 'tuple[str, dict]':
+def get_markdown_from_file(filename: str, markdown_pipe: Union[str, None]) -> str:
     """
-    Retrieves HTML from one or more markdown source files.
+    Reads a markdown file as UTF-8, the encoding the pipe command is given, and pipes it.
 
     Args:
-        item (dict): Source configuration dictionary.
+        filename (str): Path of the markdown file.
+        markdown_pipe (Union[str, None]): Pipe command, or None if no pipe.
 
     Returns:
-        str: HTML result from one or more markdown files.
-        dict: Object for storage of the files' details for later processing.
+        str: Piped markdown of the file.
     """
-    markdown_text = ''
-    is_first = True
-    for source in item['sources']:
-        if not is_first:
-            markdown_text += '\n\n'
-        is_first = False
-        with open(source, 'r') as markdown_file:
-            file_text = markdown_file.read()
-            file_text = apply_pipe(file_text, markdown_pipe)
-            markdown_text += file_text
-    html = markdown(markdown_text, extras=['fenced-code-blocks', 'markdown-in-html', 'tables'])
-    return html, item
+    with open(filename, 'r', encoding='utf-8') as markdown_file:
+        return apply_pipe(markdown_file.read(), markdown_pipe)
 
-def get_html_from_dict_with_source_directory(
-        item: dict,
-        markdown_pipe: Union[str, None]
-    ) -> 'tuple[str, dict]':
+def get_markdown_file_list(item: Union[dict, str]) -> list:
     """
-    Retrieves HTML from a directory of markdown source files.
+    Lists the markdown files referenced by a source configuration, in collation order.
 
     Args:
-        item (dict): Source configuration dictionary.
+        item (Union[dict, str]): Source configuration dictionary or string.
 
     Returns:
-        str: HTML result from one or more markdown files.
-        dict: Object for storage of the files' details for later processing.
+        list: List of markdown file paths.
     """
-    markdown_text = ''
-    is_first = True
+    if isinstance(item, str):
+        return [item]
+    if 'source' in item:
+        return [item['source']]
+    if 'sources' in item:
+        return list(item['sources'])
+    output = []
     file_list = os.listdir(item['sourceDirectory'])
     file_list.sort()
     for file_entry in file_list:
         filename = os.path.join(item['sourceDirectory'], file_entry)
         if os.path.isfile(filename) and filename.lower().endswith('.md'):
-            if not is_first:
-                markdown_text += '\n\n'
-            is_first = False
-            with open(filename, 'r') as markdown_file:
-                file_text = markdown_file.read()
-                file_text = apply_pipe(file_text, markdown_pipe)
-                markdown_text += file_text
-    html = markdown(markdown_text, extras=['fenced-code-blocks', 'markdown-in-html', 'tables'])
-    return html, item
+            output.append(filename)
+    return output
 
 def apply_pipe(markdown_text: str, pipe: Union[str, None]) -> str:
     """
@@ -227,30 +360,13 @@ def apply_pipe(markdown_text: str, pipe: Union[str, None]) -> str:
     pipe_output = subprocess.check_output(pipe, input=bytearray(markdown_text, 'utf-8'))
     return pipe_output.decode('utf-8')
 
-def wrap_with_tag(html: str, document_wrapper_class: str) -> str:
-    """
-    Wraps a string of HTML with a div using a given wrapper class
-
-    Args:
-        html (str): The HTML to be wrapped
-        document_wrapper_class(str): The class with which to wrap the HTML
-
-    Returns:
-        str: Newly wrapped HTML
-    """
-    soup = BeautifulSoup(html, 'html.parser')
-    new_div = soup.new_tag('div')
-    new_div['class'] = document_wrapper_class
-    for element in soup:
-        new_div.append(element)
-    return new_div.prettify()
-
-def get_css_data(styles: dict) -> dict:
+def get_css_data(styles: dict, context: BuildContext) -> dict:
     """
     Retrieves Weasyprint CSS objects based on a dictionary of CSS filenames.
 
     Args:
         styles (dict): Dictionary of CSS filenames, with keys as friendly names.
+        context (BuildContext): Build in which to record files read and cache CSS objects.
 
     Returns:
         dict: Dictionary of lists of Weasyprint CSS objects, with keys as friendly names.
@@ -260,57 +376,89 @@ def get_css_data(styles: dict) -> dict:
         value = styles[key]
         output[key] = []
         if isinstance(value, str):
-            css = CSS(filename=value)
+            css = context.get_css_object(value)
             output[key].append(css)
         elif isinstance(value, list):
-            output[key] = convert_list_to_css_objects(value)
+            output[key] = convert_list_to_css_objects(value, context)
         else:
-            output[key] = get_css_data_from_style_object(value)
+            output[key] = get_css_data_from_style_object(value, context)
     return output
 
-def get_css_data_from_style_object(style: dict) -> list:
+def get_stylesheet_files(style: any) -> list:
+    """
+    Lists the stylesheet files of a schema-defined style.
+
+    Args:
+        style (any): Style definition string, list or object, or None.
+
+    Returns:
+        list: List of stylesheet paths.
+    """
+    if isinstance(style, str):
+        return [style]
+    if isinstance(style, list):
+        return list(style)
+    if isinstance(style, dict) and 'stylesheet' in style:
+        return [style['stylesheet']]
+    if isinstance(style, dict):
+        return list(style.get('stylesheets', []))
+    return []
+
+def get_css_data_from_style_object(
+        style: dict,
+        context: BuildContext
+    ) -> list:
     """
     Retrieves Weasyprint CSS objects based on a schema-defined style object.
 
     Args:
         style(dict): Schema-defined style object.
+        context (BuildContext): Build in which to record files read and cache CSS objects.
 
     Returns:
         list: List of Weasyprint CSS objects.
     """
     if 'stylesheet' in style:
-        css = CSS(filename=style['stylesheet'])
+        css = context.get_css_object(style['stylesheet'])
         return [css]
     if 'stylesheets' in style:
         output = []
         for stylesheet in style['stylesheets']:
-            css = CSS(filename=stylesheet)
+            css = context.get_css_object(stylesheet)
             output.append(css)
         return output
     return []
 
-def convert_list_to_css_objects(sources: list) -> list:
+def convert_list_to_css_objects(
+        sources: list,
+        context: BuildContext
+    ) -> list:
     """
     Takes a list of filenames and outputs a list of CSS objects.
 
     Args:
         sources(list): List of filenames for CSS files.
+        context (BuildContext): Build in which to record files read and cache CSS objects.
 
     Returns:
         list: List of Weasyprint CSS objects.
     """
     output = []
     for value in sources:
-        css = CSS(filename=value)
+        css = context.get_css_object(value)
         output.append(css)
     return output
 
-def get_decorator_data_from_styles_dict(styles: dict) -> dict:
+def get_decorator_data_from_styles_dict(
+        styles: dict,
+        context: BuildContext
+    ) -> dict:
     """
     Takes a dictionary of style data objects and outputs a decorator data object.
 
     Args:
         styles(dict): Dictionary of schema-defined style data.
+        context (BuildContext): Build in which to record files read and cache CSS objects.
 
     Returns:
         dict: Dictionary of schema-defined decorator data.
@@ -319,44 +467,56 @@ def get_decorator_data_from_styles_dict(styles: dict) -> dict:
     for key in styles:
         value = styles[key]
         if isinstance(value, dict):
-            output[key] = get_decorator_data_from_style(value)
+            output[key] = get_decorator_data_from_style(value, context)
     return output
 
-def get_decorator_data_from_style(style: dict) -> list:
+def get_decorator_data_from_style(
+        style: dict,
+        context: BuildContext
+    ) -> list:
     """
     Takes a schema-defined style data object and outputs decorator data for that style.
 
     Args:
         style(dict): Schema-defined style data object
+        context (BuildContext): Build in which to record files read and cache CSS objects.
 
     Returns:
         list: List of decorators for that style.
     """
     output = []
     if 'decorator' in style:
-        output.append(get_decorator_data(style['decorator']))
+        output.append(get_decorator_data(style['decorator'], context))
     elif 'decorators' in style:
         for decorator in style['decorators']:
-            output.append(get_decorator_data(decorator))
+            output.append(get_decorator_data(decorator, context))
     return output
 
-def get_decorator_data(decorator: dict) -> dict:
+def get_decorator_data(decorator: dict, context: BuildContext) -> dict:
     """
     Takes a schema-defined decorator object and outputs HTML and CSS data for that decorator.
 
-    Args: decorator(dict): Schema-defined decorator object.
+    Args:
+        decorator(dict): Schema-defined decorator object.
+        context (BuildContext): Build in which to record files read and cache CSS objects.
 
     Returns:
-        dict: Dictionary containing 'html' and 'css' keys for that decorator.
+        dict: Dictionary containing 'html' and 'css' keys for that decorator, optional 'evenCss'
+            and 'oddCss' keys, and the paths of the stylesheets under the same keys in
+            'stylesheetFiles', for worker processes.
     """
+    context.dependencies.add_file(decorator['template'])
     with open(decorator['template'], 'r') as template_file:
         html = template_file.read()
     output = {
         'html': html,
-        'css': CSS(filename=decorator['stylesheet'])
+        'css': context.get_css_object(decorator['stylesheet']),
+        'stylesheetFiles': {'css': decorator['stylesheet']}
     }
     if 'evenStylesheet' in decorator:
-        output['evenCss'] = CSS(filename=decorator['evenStylesheet'])
+        output['evenCss'] = context.get_css_object(decorator['evenStylesheet'])
+        output['stylesheetFiles']['evenCss'] = decorator['evenStylesheet']
     if 'oddStylesheet' in decorator:
-        output['oddCss'] = CSS(filename=decorator['oddStylesheet'])
+        output['oddCss'] = context.get_css_object(decorator['oddStylesheet'])
+        output['stylesheetFiles']['oddCss'] = decorator['oddStylesheet']
     return output
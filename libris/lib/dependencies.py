@@ -0,0 +1,82 @@
+"""
+Build dependency tracking for libris.
+"""
+import os
+from urllib.parse import urlsplit
+from urllib.request import url2pathname
+from weasyprint import default_url_fetcher
+
+class DependencyGraph:
+    """
+    Records every file read while building a PDF, so that watch mode can tell which file changes
+    are relevant to the build.
+    """
+    def __init__(self):
+        self.files = set()
+        self.directories = set()
+
+    def add_file(self, file_path: str):
+        """
+        Records a file read by the build.
+
+        Args:
+            file_path (str): Path of the file, relative to the working directory or absolute.
+        """
+        self.files.add(os.path.abspath(file_path))
+
+    def add_directory(self, directory_path: str):
+        """
+        Records a directory whose listing of markdown files is read by the build. Adding or
+        removing markdown files in it affects the build.
+
+        Args:
+            directory_path (str): Path of the directory, relative to the working directory or
+                absolute.
+        """
+        self.directories.add(os.path.abspath(directory_path))
+
+    def url_fetcher(self, url: str) -> dict:
+        """
+        Weasyprint URL fetcher that records local files before fetching them with the default
+        fetcher. Catches stylesheet imports, images, and fonts referenced from HTML and CSS.
+
+        Args:
+            url (str): URL to fetch.
+
+        Returns:
+            dict: Weasyprint URL fetcher result.
+        """
+        split_url = urlsplit(url)
+        if split_url.scheme == 'file':
+            self.add_file(url2pathname(split_url.path))
+        return default_url_fetcher(url)
+
+    def is_affected_by(self, file_path: str) -> bool:
+        """
+        Checks whether a change to the given file affects the build.
+
+        Args:
+            file_path (str): Path of the changed file.
+
+        Returns:
+            bool: Whether the build depends on the file.
+        """
+        file_path = os.path.abspath(file_path)
+        if file_path in self.files:
+            return True
+        return (
+            os.path.dirname(file_path) in self.directories
+            and file_path.lower().endswith('.md')
+        )
+
+    def get_watched_directories(self) -> list:
+        """
+        Lists the unique directories containing all recorded files and directories.
+
+        Returns:
+            list: Sorted list of absolute directory paths.
+        """
+        output = set(self.directories)
+        for file_path in self.files:
+            output.add(os.path.dirname(file_path))
+        return sorted(output)
@@ -0,0 +1,379 @@
+"""
+HTML post-processing functions for libris.
+
+Converted markdown passes through a single streaming stage before Weasyprint parses it. The stage
+tokenizes the HTML once and hands each token through a chain of transforms, then wraps the result
+in the document wrapper div. Tokens that no transform changed are written back exactly as they
+were read.
+
+A transform is an object with a process method, which takes a token and returns a list of tokens
+to pass on, and a finish method, which returns any tokens still buffered at the end of the
+section. Transforms are created from the htmlTransforms configuration property, either by
+built-in name or by a 'module:attribute' import path, which is resolved relative to the working
+directory. The named attribute is called with the transform's options dictionary and must return
+a new transform.
+"""
+import importlib
+import os
+import re
+import sys
+from functools import partial
+from html import escape
+from html.parser import HTMLParser
+from typing import Callable, Union
+from .dependencies import DependencyGraph
+
+class HtmlToken:
+    """
+    A single piece of streamed HTML: a start, end or self-closing tag, text, or anything else
+    passed through unchanged, such as comments and entity references.
+    """
+    def __init__(self, kind: str, tag: str = None, attrs: list = None, text: str = None):
+        self.kind = kind
+        self.tag = tag
+        self.attrs = attrs if attrs is not None else []
+        self.text = text
+
+    def get_attribute(self, name: str) -> Union[str, None]:
+        """
+        Gets the value of a tag attribute.
+
+        Args:
+            name (str): Name of the attribute.
+
+        Returns:
+            Union[str, None]: Value of the attribute, or None if missing.
+        """
+        for attribute_name, value in self.attrs:
+            if attribute_name == name:
+                return value
+        return None
+
+    def set_attribute(self, name: str, value: str):
+        """
+        Sets the value of a tag attribute. The tag will be re-serialized on output.
+
+        Args:
+            name (str): Name of the attribute.
+            value (str): New value of the attribute.
+        """
+        self.attrs = [
+            (attribute_name, attribute_value) for attribute_name, attribute_value in self.attrs
+            if attribute_name != name
+        ]
+        self.attrs.append((name, value))
+        self.text = None
+
+    def serialize(self) -> str:
+        """
+        Converts the token back to HTML.
+
+        Returns:
+            str: HTML for the token.
+        """
+        if self.text is not None:
+            return self.text
+        if self.kind == 'endtag':
+            return f'</{self.tag}>'
+        attributes = ''
+        for name, value in self.attrs:
+            if value is None:
+                attributes += f' {name}'
+            else:
+                attributes += f' {name}="{escape(value)}"'
+        closing = ' />' if self.kind == 'startendtag' else '>'
+        return f'<{self.tag}{attributes}{closing}'
+
+class HtmlTransform:
+    """
+    Base class for HTML transforms. Passes every token through unchanged.
+    """
+    def __init__(self, options: dict):
+        self.options = options
+
+    def process(self, token: HtmlToken) -> list:
+        """
+        Processes one token.
+
+        Args:
+            token (HtmlToken): The token to process.
+
+        Returns:
+            list: Tokens to pass on to the next transform.
+        """
+        return [token]
+
+    def finish(self) -> list:
+        """
+        Called at the end of a section.
+
+        Returns:
+            list: Buffered tokens to pass on to the next transform.
+        """
+        return []
+
+class HeadingIdTransform(HtmlTransform):
+    """
+    Gives every heading without an id an id based on its text, made unique within the section.
+    The 'levels' option limits the heading levels affected and defaults to all of them.
+    """
+    def __init__(self, options: dict):
+        super().__init__(options)
+        self.tags = [f'h{level}' for level in options.get('levels', range(1, 7))]
+        self.used_ids = set()
+        self.buffer = None
+
+    def process(self, token: HtmlToken) -> list:
+        if self.buffer is None:
+            if token.kind == 'starttag' and token.tag in self.tags:
+                self.buffer = [token]
+                return []
+            return [token]
+        self.buffer.append(token)
+        if token.kind == 'endtag' and token.tag == self.buffer[0].tag:
+            return self.finish()
+        return []
+
+    def finish(self) -> list:
+        if self.buffer is None:
+            return []
+        output = self.buffer
+        self.buffer = None
+        heading = output[0]
+        existing_id = heading.get_attribute('id')
+        if existing_id is not None:
+            self.used_ids.add(existing_id)
+            return output
+        text = ''.join(token.text for token in output if token.kind == 'data')
+        heading.set_attribute('id', self.get_unique_id(text))
+        return output
+
+    def get_unique_id(self, text: str) -> str:
+        """
+        Creates an id from heading text that has not been used in this section.
+
+        Args:
+            text (str): Heading text.
+
+        Returns:
+            str: Unique id.
+        """
+        base_id = re.sub(r'[^\w]+', '-', text.lower()).strip('-') or 'section'
+        unique_id = base_id
+        suffix = 2
+        while unique_id in self.used_ids:
+            unique_id = f'{base_id}-{suffix}'
+            suffix += 1
+        self.used_ids.add(unique_id)
+        return unique_id
+
+class AddClassTransform(HtmlTransform):
+    """
+    Adds classes to tags. The 'classes' option maps tag names to the class names to add.
+    """
+    def process(self, token: HtmlToken) -> list:
+        classes = self.options.get('classes', {})
+        if token.kind in ('starttag', 'startendtag') and token.tag in classes:
+            existing_class = token.get_attribute('class')
+            if existing_class:
+                token.set_attribute('class', f'{existing_class} {classes[token.tag]}')
+            else:
+                token.set_attribute('class', classes[token.tag])
+        return [token]
+
+HTML_TRANSFORMS = {
+    'headingIds': HeadingIdTransform,
+    'addClass': AddClassTransform
+}
+
+class HtmlPostProcessor(HTMLParser):
+    """
+    Streams HTML through a chain of transforms and collects the serialized result.
+    """
+    def __init__(self, transforms: list):
+        super().__init__(convert_charrefs=False)
+        self.transforms = transforms
+        self.output = []
+
+    def emit(self, tokens: list, start: int = 0):
+        """
+        Passes tokens through the transforms from the given position onward and collects the
+        serialized result.
+
+        Args:
+            tokens (list): Tokens to pass on.
+            start (int): Index of the first transform to apply.
+        """
+        for transform in self.transforms[start:]:
+            processed_tokens = []
+            for token in tokens:
+                processed_tokens += transform.process(token)
+            tokens = processed_tokens
+        for token in tokens:
+            self.output.append(token.serialize())
+
+    def close(self):
+        super().close()
+        for index, transform in enumerate(self.transforms):
+            self.emit(transform.finish(), index + 1)
+
+    def get_output(self) -> str:
+        """
+        Gets the processed HTML.
+
+        Returns:
+            str: Processed HTML.
+        """
+        return ''.join(self.output)
+
+    def handle_starttag(self, tag, attrs):
+        self.emit([HtmlToken('starttag', tag, attrs, self.get_starttag_text())])
+
+    def handle_startendtag(self, tag, attrs):
+        self.emit([HtmlToken('startendtag', tag, attrs, self.get_starttag_text())])
+
+    def handle_endtag(self, tag):
+        self.emit([HtmlToken('endtag', tag)])
+
+    def handle_data(self, data):
+        self.emit([HtmlToken('data', text=data)])
+
+    def handle_entityref(self, name):
+        self.emit([HtmlToken('other', text=f'&{name};')])
+
+    def handle_charref(self, name):
+        self.emit([HtmlToken('other', text=f'&#{name};')])
+
+    def handle_comment(self, data):
+        self.emit([HtmlToken('other', text=f'<!--{data}-->')])
+
+    def handle_decl(self, decl):
+        self.emit([HtmlToken('other', text=f'<!{decl}>')])
+
+    def handle_pi(self, data):
+        self.emit([HtmlToken('other', text=f'<?{data}>')])
+
+    def unknown_decl(self, data):
+        self.emit([HtmlToken('other', text=f'<![{data}]>')])
+
+def get_html_transform_factories(transform_configs: list, dependencies: DependencyGraph) -> list:
+    """
+    Creates a factory for each configured transform. A new transform is created for every
+    section, so transforms may keep state within a section.
+
+    Args:
+        transform_configs (list): List of schema-defined transform objects.
+        dependencies (DependencyGraph): Graph in which to record custom transform modules.
+
+    Returns:
+        list: List of functions that each return a new transform.
+    """
+    output = []
+    for transform_config in transform_configs:
+        name = transform_config['transform']
+        options = transform_config.get('options', {})
+        if name in HTML_TRANSFORMS:
+            transform_class = HTML_TRANSFORMS[name]
+        elif ':' in name:
+            transform_class = import_html_transform(name, dependencies)
+        else:
+            raise ValueError(
+                f'Unknown HTML transform "{name}". Use one of {", ".join(HTML_TRANSFORMS)} or a'\
+                ' "module:attribute" import path.'
+            )
+        output.append(partial(transform_class, options))
+    return output
+
+def import_html_transform(
+        import_path: str,
+        dependencies: DependencyGraph
+    ) -> Callable[[dict], HtmlTransform]:
+    """
+    Imports a custom transform from a 'module:attribute' path. Like the other paths in the
+    configuration, the module is looked up relative to the working directory first, and then on
+    the Python path. A module imported by an earlier build is reloaded, so that watch mode picks
+    up changes to it, and its file is recorded as a dependency of the build.
+
+    Args:
+        import_path (str): Import path of the transform.
+        dependencies (DependencyGraph): Graph in which to record the module's file.
+
+    Returns:
+        Callable[[dict], HtmlTransform]: Attribute that creates the transform from its options.
+    """
+    module_name, attribute_name = import_path.split(':', 1)
+    try:
+        module = load_transform_module(module_name)
+        transform = getattr(module, attribute_name)
+    except (ImportError, AttributeError) as err:
+        raise ValueError(f'Could not import HTML transform "{import_path}": {err}') from err
+    if getattr(module, '__file__', None):
+        dependencies.add_file(module.__file__)
+    return transform
+
+def load_transform_module(module_name: str) -> any:
+    """
+    Imports a custom transform module, looking in the working directory first. A module that is
+    already imported is reloaded.
+
+    Args:
+        module_name (str): Name of the module.
+
+    Returns:
+        module: The imported module.
+    """
+    working_directory = os.getcwd()
+    sys.path.insert(0, working_directory)
+    try:
+        if module_name in sys.modules:
+            return importlib.reload(sys.modules[module_name])
+        return importlib.import_module(module_name)
+    finally:
+        sys.path.remove(working_directory)
+
+def get_html_processor(
+        document_wrapper_class: Union[str, None],
+        transform_configs: list,
+        dependencies: DependencyGraph
+    ) -> Callable[[str], str]:
+    """
+    Creates the post-processing function applied to the HTML of every section.
+
+    Args:
+        document_wrapper_class (Union[str, None]): Optional div class with which to wrap HTML.
+        transform_configs (list): List of schema-defined transform objects.
+        dependencies (DependencyGraph): Graph in which to record custom transform modules.
+
+    Returns:
+        Callable[[str], str]: Function that post-processes a section's HTML.
+    """
+    return partial(
+        process_html,
+        document_wrapper_class=document_wrapper_class,
+        transform_factories=get_html_transform_factories(transform_configs, dependencies)
+    )
+
+def process_html(
+        html: str,
+        document_wrapper_class: Union[str, None],
+        transform_factories: list
+    ) -> str:
+    """
+    Post-processes a section's HTML. The HTML is only parsed when there are transforms to apply.
+
+    Args:
+        html (str): HTML converted from markdown.
+        document_wrapper_class (Union[str, None]): Optional div class with which to wrap HTML.
+        transform_factories (list): Factories from get_html_transform_factories.
+
+    Returns:
+        str: Processed HTML.
+    """
+    if transform_factories:
+        processor = HtmlPostProcessor([factory() for factory in transform_factories])
+        processor.feed(html)
+        processor.close()
+        html = processor.get_output()
+    if document_wrapper_class:
+        html = f'<div class="{escape(document_wrapper_class)}">\n{html}\n</div>'
+    return html
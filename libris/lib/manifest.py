@@ -0,0 +1,160 @@
+"""
+Build manifest functions for libris.
+
+A manifest is written next to each PDF output. It records a hash of the configuration and of every
+file the build read, the libris and Weasyprint versions, and the page count of each section. A
+later build whose inputs all match can be skipped.
+"""
+import hashlib
+import json
+import os
+from typing import Union
+import weasyprint
+from .constants import LIBRIS_VERSION
+from .data_extractors import get_json_data
+from .dependencies import DependencyGraph
+
+MANIFEST_SUFFIX = '.manifest.json'
+
+def get_manifest_path(output_file_path: str) -> str:
+    """
+    Gets the manifest path for a PDF output path.
+
+    Args:
+        output_file_path (str): Path of the PDF output.
+
+    Returns:
+        str: Path of the manifest.
+    """
+    return output_file_path + MANIFEST_SUFFIX
+
+def get_file_hash(file_path: str) -> Union[str, None]:
+    """
+    Hashes the contents of a file.
+
+    Args:
+        file_path (str): Path of the file.
+
+    Returns:
+        Union[str, None]: Hexadecimal SHA-256 hash, or None if the file does not exist.
+    """
+    if not os.path.isfile(file_path):
+        return None
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as input_file:
+        for block in iter(lambda: input_file.read(65536), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+def get_directory_listing(directory_path: str) -> list:
+    """
+    Lists the markdown files in a directory, as read by sourceDirectory sources.
+
+    Args:
+        directory_path (str): Path of the directory.
+
+    Returns:
+        list: Sorted list of markdown file names.
+    """
+    if not os.path.isdir(directory_path):
+        return []
+    output = []
+    for file_entry in sorted(os.listdir(directory_path)):
+        if file_entry.lower().endswith('.md'):
+            output.append(file_entry)
+    return output
+
+def write_manifest(
+        output_file_path: str,
+        config_hash: str,
+        dependencies: DependencyGraph,
+        page_counts: list
+    ):
+    """
+    Writes the manifest for a PDF output.
+
+    Args:
+        output_file_path (str): Path of the PDF output.
+        config_hash (str): Hash of the configuration, from get_config_hash.
+        dependencies (DependencyGraph): Every file read during the build.
+        page_counts (list): Page count of each section of the output.
+    """
+    manifest = {
+        'librisVersion': LIBRIS_VERSION,
+        'weasyprintVersion': weasyprint.__version__,
+        'configHash': config_hash,
+        'inputs': {},
+        'directories': {},
+        'pageCounts': page_counts
+    }
+    for file_path in sorted(dependencies.files):
+        manifest['inputs'][file_path] = get_file_hash(file_path)
+    for directory_path in sorted(dependencies.directories):
+        manifest['directories'][directory_path] = get_directory_listing(directory_path)
+    with open(get_manifest_path(output_file_path), 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=4)
+
+def read_manifest(output_file_path: str) -> Union[dict, None]:
+    """
+    Reads the manifest for a PDF output.
+
+    Args:
+        output_file_path (str): Path of the PDF output.
+
+    Returns:
+        Union[dict, None]: Manifest data, or None if there is no readable manifest.
+    """
+    manifest_path = get_manifest_path(output_file_path)
+    if not os.path.isfile(manifest_path):
+        return None
+    try:
+        return get_json_data(manifest_path)
+    except ValueError:
+        return None
+
+def is_output_up_to_date(output_file_path: str, config_hash: str) -> bool:
+    """
+    Checks whether a PDF output was built from exactly the current inputs.
+
+    Args:
+        output_file_path (str): Path of the PDF output.
+        config_hash (str): Hash of the current configuration, from get_config_hash.
+
+    Returns:
+        bool: Whether the output and its manifest exist and every recorded input is unchanged.
+    """
+    manifest = read_manifest(output_file_path)
+    if manifest is None or not os.path.isfile(output_file_path):
+        return False
+    if (
+            manifest.get('librisVersion') != LIBRIS_VERSION
+            or manifest.get('weasyprintVersion') != weasyprint.__version__
+            or manifest.get('configHash') != config_hash
+        ):
+        return False
+    for directory_path, listing in manifest.get('directories', {}).items():
+        if get_directory_listing(directory_path) != listing:
+            return False
+    for file_path, file_hash in manifest.get('inputs', {}).items():
+        if get_file_hash(file_path) != file_hash:
+            return False
+    return True
+
+def get_manifest_dependencies(output_file_paths: list) -> DependencyGraph:
+    """
+    Rebuilds the dependency graph recorded in the manifests of skipped outputs.
+
+    Args:
+        output_file_paths (list): Paths of the PDF outputs.
+
+    Returns:
+        DependencyGraph: Every file read during the recorded builds.
+    """
+    dependencies = DependencyGraph()
+    for output_file_path in output_file_paths:
+        manifest = read_manifest(output_file_path) or {}
+        for file_path in manifest.get('inputs', {}):
+            dependencies.add_file(file_path)
+        for directory_path in manifest.get('directories', {}):
+            dependencies.add_directory(directory_path)
+    return dependencies
@@ -0,0 +1,123 @@
+"""
+Markdown engine functions for libris.
+
+An engine is a function that takes a string of Markdown and returns a string of HTML. Engines are
+looked up by name from the MARKDOWN_ENGINES dictionary. A new backend needs a conversion
+function, an entry there, and its name added to the markdownEngine enum in
+json-schemas/config-schema.json, which lists the engine names for validation and editor
+auto-complete.
+"""
+import difflib
+from typing import Callable
+from markdown2 import markdown
+
+def convert_with_markdown2(text: str) -> str:
+    """
+    Converts Markdown to HTML using markdown2. This is the default engine.
+
+    Args:
+        text (str): Markdown text to convert.
+
+    Returns:
+        str: Resulting HTML.
+    """
+    return markdown(text, extras=['fenced-code-blocks', 'markdown-in-html', 'tables'])
+
+def convert_with_cmarkgfm(text: str) -> str:
+    """
+    Converts Markdown to HTML using cmarkgfm, a C implementation of GitHub Flavored Markdown.
+    Raw HTML is passed through unchanged to match markdown2's behavior, so the GFM tagfilter
+    extension, which escapes tags such as style and script, is not enabled.
+
+    Args:
+        text (str): Markdown text to convert.
+
+    Returns:
+        str: Resulting HTML.
+    """
+    try:
+        import cmarkgfm # pylint: disable=import-outside-toplevel
+        from cmarkgfm.cmark import Options # pylint: disable=import-outside-toplevel
+    except ImportError as err:
+        raise ImportError(
+            'The cmarkgfm markdown engine requires the cmarkgfm package. '\
+            'Install it with `pip install cmarkgfm`.'
+        ) from err
+    return cmarkgfm.markdown_to_html_with_extensions(
+        text,
+        options=Options.CMARK_OPT_UNSAFE,
+        extensions=['table', 'strikethrough', 'autolink']
+    )
+
+DEFAULT_MARKDOWN_ENGINE = 'markdown2'
+
+MARKDOWN_ENGINES = {
+    'markdown2': convert_with_markdown2,
+    'cmarkgfm': convert_with_cmarkgfm
+}
+
+def get_markdown_engine(engine_name: str) -> Callable[[str], str]:
+    """
+    Retrieves a Markdown conversion function by name.
+
+    Args:
+        engine_name (str): Name of the engine, as a key of MARKDOWN_ENGINES. If None, the default
+            engine is used.
+
+    Returns:
+        Callable[[str], str]: Function that converts Markdown text to HTML.
+    """
+    if engine_name is None:
+        engine_name = DEFAULT_MARKDOWN_ENGINE
+    if engine_name not in MARKDOWN_ENGINES:
+        raise ValueError(
+            f'Unknown markdown engine "{engine_name}". '\
+            f'Available engines: {", ".join(MARKDOWN_ENGINES)}'
+        )
+    return MARKDOWN_ENGINES[engine_name]
+
+def get_engine_differences(
+        text: str,
+        base_engine_name: str,
+        engine_name: str,
+        label: str = 'markdown'
+    ) -> list:
+    """
+    Converts Markdown with two engines and lists where the results differ. Whitespace-only
+    differences between lines are ignored.
+
+    Args:
+        text (str): Markdown text to convert.
+        base_engine_name (str): Name of the engine currently in use.
+        engine_name (str): Name of the engine to compare against it.
+        label (str): Name used for the input in the diff headers.
+
+    Returns:
+        list: Unified diff lines. An empty list means the outputs match.
+    """
+    base_lines = normalize_html_lines(get_markdown_engine(base_engine_name)(text))
+    engine_lines = normalize_html_lines(get_markdown_engine(engine_name)(text))
+    return list(difflib.unified_diff(
+        base_lines,
+        engine_lines,
+        fromfile=f'{label} ({base_engine_name})',
+        tofile=f'{label} ({engine_name})',
+        lineterm=''
+    ))
+
+def normalize_html_lines(html: str) -> list:
+    """
+    Splits HTML into stripped, non-empty lines for comparison.
+
+    Args:
+        html (str): HTML to split.
+
+    Returns:
+        list: List of stripped lines.
+    """
+    output = []
+    for line in html.splitlines():
+        line = line.strip()
+        if line:
+            output.append(line)
+    return output
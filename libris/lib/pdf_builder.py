@@ -1,98 +1,538 @@
 """
 Defines the core PDF building functions for libris.
 """
-from typing import Union
+import io
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+from typing import Callable, Union
 import jinja2 
-from weasyprint import HTML, Document
+from weasyprint import HTML, CSS, Document
+from .build_context import BuildContext
+from .dependencies import DependencyGraph
 from .data_extractors import (
-    get_css_data, get_decorator_data_from_styles_dict, get_default_style, get_html_data
+    get_config_hash, get_css_data, get_decorator_data_from_styles_dict, get_default_style,
+    get_html_data, get_stylesheet_files, get_variants
 )
+from .manifest import (
+    get_manifest_dependencies, is_output_up_to_date, write_manifest
+)
+from .html_processing import get_html_processor
+from .markdown_engines import get_markdown_engine
+
+DECORATOR_TEMPLATE_CACHE_SIZE = 64
 
-def build_pdf(config: dict, be_verbose: bool) -> None:
+def build_pdf(config: dict, be_verbose: bool, force: bool) -> DependencyGraph:
     """
-    Builds a PDF from Markdown based on a standardized configuration file.
+    Builds a PDF from Markdown based on a standardized configuration file. When the configuration
+    has output variants, one PDF is written per variant. Markdown conversion and CSS parsing run
+    once for all variants, and sections that resolve to the same stylesheets share their layout.
+    A manifest is written next to each output, and the build is skipped when every output's
+    manifest matches the current inputs.
 
     Args:
         config (dict): Configuration data to use for PDF generation.
         be_verbose (bool): Whether to print additional debugging information.
+        force (bool): Whether to build even if the outputs are up to date.
+
+    Returns:
+        DependencyGraph: Every file read during the build.
     """
-    sources = config['sources']
-    styles = config.get('styles', {})
-    default_style_key = config.get('defaultStyle')
-    document_wrapper_class = config.get('documentWrapperClass')
-    output_file_path = config['output']
-    markdown_pipe = config.get('markdownPipe', None)
-    html_data = get_html_data(sources, document_wrapper_class, markdown_pipe, be_verbose)
-    css_data = get_css_data(styles)
-    decorator_data = get_decorator_data_from_styles_dict(styles)
-    default_style = get_default_style(default_style_key, css_data)
-    generate_pdf(
-        html_data,
-        css_data,
-        decorator_data,
-        default_style,
-        default_style_key,
-        output_file_path
+    config_hash = get_config_hash(config)
+    variants = get_variants(config)
+    if not force and is_build_up_to_date(variants, config_hash):
+        return get_manifest_dependencies([variant['output'] for variant in variants])
+    context = BuildContext(be_verbose)
+    process_html = get_html_processor(
+        config.get('documentWrapperClass'),
+        config.get('htmlTransforms', []),
+        context.dependencies
+    )
+    html_data = get_html_data(
+        config['sources'],
+        process_html,
+        config.get('markdownPipe', None),
+        get_markdown_engine(config.get('markdownEngine')),
+        context
     )
+    page_counts = generate_variants(variants, html_data, context)
+    for output_file_path, variant_page_counts in page_counts.items():
+        write_manifest(output_file_path, config_hash, context.dependencies, variant_page_counts)
+    return context.dependencies
 
-def generate_pdf(
-        html_data: list,
-        css_data: dict,
-        decorator_data: dict,
-        default_style: Union[list, None],
-        default_style_key: Union[str, None],
-        output_file_path: str
-    ) -> None:
+def is_build_up_to_date(variants: list, config_hash: str) -> bool:
+    """
+    Checks whether every variant's output is up to date, and says so if it is.
+
+    Args:
+        variants (list): Variants from get_variants.
+        config_hash (str): Hash of the current configuration.
+
+    Returns:
+        bool: Whether the build can be skipped.
+    """
+    if all(is_output_up_to_date(variant['output'], config_hash) for variant in variants):
+        print('Output is up to date, skipping build. Use --force to rebuild.')
+        return True
+    return False
+
+def generate_variants(variants: list, html_data: list, context: BuildContext) -> dict:
     """
-    Creates and writes a PDF from a list of source data and config options.
+    Writes the PDF of each variant. CSS objects and layouts are shared between variants.
 
     Args:
+        variants (list): Variants from get_variants.
         html_data (list): List of dictionaries containing Weasyprint HTML objects and
             configuration data.
-        css_data (dict): Dictionary of Weasyprint CSS objects, with keys as friendly names.
-        decorator_data (dict): Dictionary of data about applicable decorators for each style
-        default_style (str): Default style to use for PDF output, referencing css_data dictionary
-            key.
-        output_file_path (str): Path to which to write resulting PDF.
+        context (BuildContext): Build in which to record files read and cache CSS and layouts.
+
+    Returns:
+        dict: Page count of each section, keyed by output file path.
+    """
+    page_counts = {}
+    for variant in variants:
+        page_counts[variant['output']] = generate_pdf(html_data, variant, context)
+    return page_counts
+
+def generate_pdf(html_data: list, variant: dict, context: BuildContext) -> list:
+    """
+    Creates and writes the PDF of one variant from a list of source data.
+
+    Args:
+        html_data (list): List of dictionaries containing Weasyprint HTML objects and
+            configuration data.
+        variant (dict): Variant returned by get_variants.
+        context (BuildContext): Build in which to record files read and cache CSS and layouts.
+
+    Returns:
+        list: Page count of each section.
+    """
+    sections = render_sections(html_data, variant, context)
+    write_sections(sections, variant['output'])
+    return [get_page_count(section) for section in sections]
+
+def render_sections(html_data: list, variant: dict, context: BuildContext) -> list:
+    """
+    Renders every section of one variant, numbering pages across sections.
+
+    Args:
+        html_data (list): List of dictionaries containing Weasyprint HTML objects and
+            configuration data.
+        variant (dict): Variant returned by get_variants.
+        context (BuildContext): Build in which to record files read and cache CSS and layouts.
+
+    Returns:
+        list: Rendered sections, as returned by render_section.
     """
-    pdfs = []
+    css_data = get_css_data(variant['styles'], context)
+    decorator_data = get_decorator_data_from_styles_dict(variant['styles'], context)
+    sections = []
     count = 1
-    for html_config in html_data:
-        html = html_config['html']
-        style_name = html_config.get('style', default_style_key)
-        style = css_data.get(style_name, default_style)
-        pdf = render_pdf(
-            html,
-            style,
-            decorator_data.get(style_name, []),
+    for section_index, html_config in enumerate(html_data):
+        section_style = get_section_style(html_config, variant, css_data, decorator_data)
+        section = render_section(
+            html_config,
+            section_style,
             count,
-            html_config.get('variables', {})
+            get_layout_key(section_index, section_style['css']),
+            context
         )
-        pdfs.append(pdf)
-        count += len(pdf.pages)
-    all_pages = gather_pages(pdfs)
-    pdfs[0].copy(all_pages).write_pdf(target=output_file_path)
+        sections.append(section)
+        count += get_page_count(section)
+    return sections
+
+def get_section_style(
+        html_config: dict,
+        variant: dict,
+        css_data: dict,
+        decorator_data: dict
+    ) -> dict:
+    """
+    Resolves the style of a section within a variant.
+
+    Args:
+        html_config (dict): Source configuration, from get_html_data.
+        variant (dict): Variant returned by get_variants.
+        css_data (dict): Dictionary of the variant's Weasyprint CSS objects, with keys as
+            friendly names.
+        decorator_data (dict): Dictionary of the variant's decorators for each style.
+
+    Returns:
+        dict: Dictionary with the section's CSS objects under 'css', their paths under
+            'stylesheetFiles' and its decorators under 'decorators'.
+    """
+    styles = variant['styles']
+    default_style_key = variant['defaultStyle']
+    style_name = html_config.get('style', default_style_key)
+    return {
+        'css': css_data.get(style_name, get_default_style(default_style_key, css_data)),
+        'stylesheetFiles': get_stylesheet_files(
+            styles.get(style_name, styles.get(default_style_key))
+        ),
+        'decorators': decorator_data.get(style_name, [])
+    }
+
+def render_section(
+        html_config: dict,
+        section_style: dict,
+        count: int,
+        layout_key: tuple,
+        context: BuildContext
+    ) -> Union[Document, list]:
+    """
+    Renders one section, as a Weasyprint Document, or for a split source as a list of pypdf
+    readers with one reader per chunk.
+
+    Args:
+        html_config (dict): Source configuration with parsed HTML, from get_html_data.
+        section_style (dict): Style of the section, from get_section_style.
+        count (int): Current page count at the beginning of this section.
+        layout_key (tuple): Key identifying this section and stylesheet set in the layout cache.
+        context (BuildContext): Build in which to record files read and cache layouts.
 
-def render_pdf(html: str, style: list, decorator_data: list, count: int, variables: dict):
+    Returns:
+        Union[Document, list]: Rendered section.
+    """
+    if 'htmlChunks' in html_config:
+        return render_split_section(html_config, section_style, count, layout_key, context)
+    return render_pdf(html_config, section_style, count, layout_key, context)
+
+def render_pdf(
+        html_config: dict,
+        section_style: dict,
+        count: int,
+        layout_key: tuple,
+        context: BuildContext
+    ) -> Document:
+    """
+    Renders a Weasyprint Document object from an HTML object and additional rendering data. The
+    layout is reused from the cache when available and its previous decorators are removed.
+
+    Args:
+        html_config (dict): Source configuration with parsed HTML, from get_html_data.
+        section_style (dict): Style of the section, from get_section_style.
+        count (int): Current page count at the beginning of this section.
+        layout_key (tuple): Key identifying this section and stylesheet set in the layout cache.
+        context (BuildContext): Build in which to cache layouts, whose URL fetcher is used for
+            decorator resources.
+
+    Returns:
+        Document: Rendered section.
+    """
+    pdf, body_children = context.get_layout(
+        layout_key,
+        lambda: render_html(html_config['html'], section_style['css'])
+    )
+    remove_decorators(pdf, body_children)
+    add_decorators(
+        pdf,
+        section_style['decorators'],
+        count,
+        html_config.get('variables', {}),
+        context.dependencies.url_fetcher
+    )
+    return pdf
+
+def render_split_section(
+        html_config: dict,
+        section_style: dict,
+        count: int,
+        layout_key: tuple,
+        context: BuildContext
+    ) -> list:
     """
-    Renders a Weasyprint Document object from an HTML object and additional rendering data.
+    Renders a split section. The chunks are laid out to PDF in worker processes, which keeps the
+    main process free of their layouts, and decorators are drawn over the resulting pages.
 
     Args:
-        html (str): HTML string for the document to be rendered.
-        style (list): List of styles to apply to the HTML.
-        decorator_data (dict): Decorator configuration to apply.
+        html_config (dict): Source configuration with HTML chunks, from get_html_data.
+        section_style (dict): Style of the section, from get_section_style.
         count (int): Current page count at the beginning of this section.
-        variables (dict): Variables to be applied to decorators for the current document.
+        layout_key (tuple): Key identifying this section and stylesheet set in the layout cache.
+        context (BuildContext): Build in which to record files read and cache layouts.
+
+    Returns:
+        list: List of pypdf readers, one per chunk, with decorators applied.
+    """
+    pypdf = get_pypdf('Splitting sources')
+    chunk_pdfs = context.get_layout(
+        layout_key,
+        lambda: layout_chunks(
+            html_config['htmlChunks'],
+            section_style['stylesheetFiles'],
+            context.dependencies
+        )
+    )
+    readers = [pypdf.PdfReader(io.BytesIO(chunk_pdf)) for chunk_pdf in chunk_pdfs]
+    overlays = []
+    for reader in readers:
+        overlays += get_decorator_overlays(
+            reader,
+            section_style['decorators'],
+            count,
+            html_config.get('variables', {})
+        )
+        count += len(reader.pages)
+    overlay_decorators(overlays, context.dependencies)
+    return readers
+
+def layout_chunks(
+        html_chunks: list,
+        stylesheet_files: list,
+        dependencies: DependencyGraph
+    ) -> list:
+    """
+    Lays out the chunks of a split section to PDF in worker processes. Weasyprint layout holds
+    the global interpreter lock, so only processes lay out chunks in parallel.
+
+    Args:
+        html_chunks (list): HTML strings for the chunks of the section.
+        stylesheet_files (list): Paths of the stylesheets to apply to the HTML.
+        dependencies (DependencyGraph): Graph in which to record files read by the workers.
+
+    Returns:
+        list: PDF bytes of each chunk, in order.
+    """
+    with ProcessPoolExecutor() as executor:
+        results = list(executor.map(render_html_pdf, html_chunks, repeat(stylesheet_files)))
+    output = []
+    for chunk_pdf, file_paths in results:
+        for file_path in file_paths:
+            dependencies.add_file(file_path)
+        output.append(chunk_pdf)
+    return output
+
+def render_html_pdf(html_string: str, stylesheet_files: list) -> 'tuple[bytes, list]':
+    """
+    Lays out HTML to PDF. Runs in a worker process, for a chunk of a split section or a decorator,
+    so it builds its own Weasyprint objects from the HTML string and stylesheet paths.
+
+    Args:
+        html_string (str): HTML to lay out.
+        stylesheet_files (list): Paths of the stylesheets to apply to the HTML.
+
+    Returns:
+        bytes: PDF of the HTML.
+        list: Paths of the files read while laying out the HTML.
+    """
+    dependencies = DependencyGraph()
+    html = HTML(string=html_string, base_url='.', url_fetcher=dependencies.url_fetcher)
+    stylesheets = []
+    for stylesheet_file in stylesheet_files:
+        stylesheets.append(CSS(filename=stylesheet_file, url_fetcher=dependencies.url_fetcher))
+    pdf = html.render(stylesheets=stylesheets).write_pdf()
+    return pdf, sorted(dependencies.files)
+
+def get_decorator_overlays(
+        reader: any,
+        decorators: list,
+        count: int,
+        variables: dict
+    ) -> list:
+    """
+    Lists the decorators to draw over each page of a PDF, with their templates processed for the
+    page number.
+
+    Args:
+        reader (PdfReader): pypdf reader whose pages are to be decorated.
+        decorators (list): Decorator data to add to every page.
+        count (int): Page number of the first page.
+        variables (dict): Variables to be applied to the decorators.
+
+    Returns:
+        list: List of (page, decorator HTML, stylesheet paths) tuples for overlay_decorators.
+    """
+    output = []
+    for page in reader.pages:
+        for decorator in decorators:
+            final_html_string = process_decorator_template(decorator['html'], count, variables)
+            stylesheet_files = tuple(
+                decorator['stylesheetFiles'][key]
+                for key in get_decorator_stylesheet_keys(decorator, count)
+            )
+            output.append((page, final_html_string, stylesheet_files))
+        count += 1
+    return output
+
+def overlay_decorators(overlays: list, dependencies: DependencyGraph):
+    """
+    Renders decorators to PDF in worker processes and draws them over PDF pages. Each distinct
+    decorator HTML and stylesheet set is rendered once, so a decorator that does not change from
+    page to page is only rendered once.
+
+    Args:
+        overlays (list): Tuples returned by get_decorator_overlays. Their pages are modified.
+        dependencies (DependencyGraph): Graph in which to record files read by the workers.
+    """
+    if not overlays:
+        return
+    decorator_pages = render_decorator_pages(
+        list(dict.fromkeys(overlay[1:] for overlay in overlays)),
+        dependencies
+    )
+    for page, final_html_string, stylesheet_files in overlays:
+        overlay_page(page, decorator_pages[(final_html_string, stylesheet_files)])
+
+def render_decorator_pages(renders: list, dependencies: DependencyGraph) -> dict:
+    """
+    Renders decorators to PDF in worker processes. Weasyprint layout holds the global interpreter
+    lock, so only processes render decorators in parallel.
+
+    Args:
+        renders (list): List of distinct (decorator HTML, stylesheet paths) tuples.
+        dependencies (DependencyGraph): Graph in which to record files read by the workers.
+
+    Returns:
+        dict: pypdf page of each rendered decorator, keyed by its tuple.
+    """
+    pypdf = get_pypdf('Drawing decorators over PDF pages')
+    with ProcessPoolExecutor() as executor:
+        results = list(executor.map(render_html_pdf, *zip(*renders)))
+    output = {}
+    for render, (decorator_pdf, file_paths) in zip(renders, results):
+        for file_path in file_paths:
+            dependencies.add_file(file_path)
+        output[render] = pypdf.PdfReader(io.BytesIO(decorator_pdf)).pages[0]
+    return output
+
+def overlay_page(page: any, decorator_page: any):
+    """
+    Draws a rendered decorator over a PDF page. The decorator is aligned to the top left corner
+    of the page, matching decorators added to Weasyprint Documents.
+
+    Args:
+        page (PageObject): pypdf page to be modified.
+        decorator_page (PageObject): pypdf page of the rendered decorator.
+    """
+    pypdf = get_pypdf('Drawing decorators over PDF pages')
+    decorator_top = float(decorator_page.mediabox.top) # pylint: disable=no-member
+    offset = float(page.mediabox.top) - decorator_top
+    page.merge_transformed_page(decorator_page, pypdf.Transformation().translate(0, offset))
+
+def write_sections(sections: list, output_file_path: str):
+    """
+    Writes rendered sections to one PDF. When every section is a Weasyprint Document, their pages
+    are written together by Weasyprint. Otherwise every section is appended with pypdf, which
+    keeps each section's bookmarks but not links between sections.
+
+    Args:
+        sections (list): Sections returned by render_section.
+        output_file_path (str): Path to which to write resulting PDF.
+    """
+    if all(isinstance(section, Document) for section in sections):
+        sections[0].copy(gather_pages(sections)).write_pdf(target=output_file_path)
+        return
+    pypdf = get_pypdf('Splitting sources')
+    writer = pypdf.PdfWriter()
+    for section in sections:
+        if isinstance(section, Document):
+            section = [pypdf.PdfReader(io.BytesIO(section.write_pdf()))]
+        for reader in section:
+            writer.append(reader)
+    with open(output_file_path, 'wb') as output_file:
+        writer.write(output_file)
+
+def get_page_count(section: Union[Document, list]) -> int:
+    """
+    Counts the pages of a rendered section.
+
+    Args:
+        section (Union[Document, list]): Section returned by render_section.
+
+    Returns:
+        int: Number of pages.
+    """
+    if isinstance(section, Document):
+        return len(section.pages)
+    return sum(len(reader.pages) for reader in section)
+
+def get_pypdf(feature: str) -> any:
+    """
+    Imports pypdf, which is only required for split sources and sharded builds.
+
+    Args:
+        feature (str): Description of the feature that requires pypdf, for the error message.
+
+    Returns:
+        module: The pypdf module.
+    """
+    try:
+        import pypdf # pylint: disable=import-outside-toplevel
+    except ImportError as err:
+        raise ImportError(
+            f'{feature} requires pypdf 3.0.0 or later. Install it with `pip install pypdf`.'
+        ) from err
+    return pypdf
+
+def render_html(html: HTML, style: Union[list, None]) -> 'tuple[Document, list]':
+    """
+    Lays out a Weasyprint HTML object.
+
+    Args:
+        html (HTML): HTML object to lay out.
+        style (Union[list, None]): List of styles to apply to the HTML.
+
+    Returns:
+        Document: Laid out document.
+        list: Undecorated body contents of each page, from get_page_body_children.
     """
     if style is None:
         pdf = html.render()
-        add_decorators(pdf, decorator_data, count, variables)
-        return pdf
-    pdf = html.render(stylesheets=style)
-    add_decorators(pdf, decorator_data, count, variables)
-    return pdf
+    else:
+        pdf = html.render(stylesheets=style)
+    return pdf, get_page_body_children(pdf)
 
-def add_decorators(pdf: Document, decorator_data: list, count: int, variables: dict):
+def get_layout_key(section_index: int, style: Union[list, None]) -> tuple:
+    """
+    Builds a layout cache key for a section. CSS objects are only created once per build, so
+    identical stylesheet sets have identical object ids.
+
+    Args:
+        section_index (int): Index of the section in the sources list.
+        style (Union[list, None]): List of CSS objects applied to the section.
+
+    Returns:
+        tuple: Layout cache key.
+    """
+    if style is None:
+        return (section_index, None)
+    return (section_index, tuple(id(css) for css in style))
+
+def get_page_body_children(pdf: Document) -> list:
+    """
+    Records the undecorated body contents of each page of a Weasyprint Document.
+
+    Args:
+        pdf (Document): Freshly rendered document.
+
+    Returns:
+        list: List of body child box lists, one per page.
+    """
+    output = []
+    for page in pdf.pages:
+        body = get_element(page._page_box.all_children(), 'body')
+        output.append(list(body.children))
+    return output
+
+def remove_decorators(pdf: Document, body_children: list):
+    """
+    Restores the undecorated body contents of each page of a Weasyprint Document.
+
+    Args:
+        pdf (Document): Document object to be modified.
+        body_children (list): Body child box lists returned by get_page_body_children.
+    """
+    for page, children in zip(pdf.pages, body_children):
+        body = get_element(page._page_box.all_children(), 'body')
+        body.children = list(children)
+
+def add_decorators(
+        pdf: Document,
+        decorator_data: list,
+        count: int,
+        variables: dict,
+        url_fetcher: Callable[[str], dict]
+    ):
     """
     Adds decorator data to a Weasyprint Document.
 
@@ -101,20 +541,38 @@ def add_decorators(pdf: Document, decorator_data: list, count: int, variables: d
         decorator_data (dict): Decorator data to add to document.
         count (int): Current page count at the beginning of this section.
         variables (dict): Variables to be applied to decorators.
+        url_fetcher (Callable[[str], dict]): Weasyprint URL fetcher for decorator resources.
     """
     for page in pdf.pages:
         for decorator in decorator_data:
             final_html_string = process_decorator_template(decorator['html'], count, variables)
-            html = HTML(string=final_html_string, base_url='.')
             stylesheets = get_stylesheets_for_decorator(decorator, count)
-            doc = html.render(stylesheets=stylesheets)
-            decorator_page = doc.pages[0]
-            decorator_body = get_element(decorator_page._page_box.all_children(), 'body')
-            decorator = decorator_body.copy_with_children(decorator_body.all_children())
             body = get_element(page._page_box.all_children(), 'body')
-            body.children += decorator_body.all_children()
+            body.children += render_decorator(final_html_string, stylesheets, url_fetcher)
         count += 1
 
+def render_decorator(
+        final_html_string: str,
+        stylesheets: list,
+        url_fetcher: Callable[[str], dict]
+    ) -> list:
+    """
+    Renders a decorator and returns its body contents.
+
+    Args:
+        final_html_string (str): Interpolated decorator template.
+        stylesheets (list): List of CSS documents for the decorator.
+        url_fetcher (Callable[[str], dict]): Weasyprint URL fetcher for decorator resources.
+
+    Returns:
+        list: Boxes to be added to the body of a page.
+    """
+    html = HTML(string=final_html_string, base_url='.', url_fetcher=url_fetcher)
+    doc = html.render(stylesheets=stylesheets)
+    decorator_page = doc.pages[0]
+    decorator_body = get_element(decorator_page._page_box.all_children(), 'body')
+    return decorator_body.all_children()
+
 def get_stylesheets_for_decorator(decorator: dict, count: int) -> list:
     """
     Gets stylesheets for a decorator.
@@ -126,12 +584,25 @@ def get_stylesheets_for_decorator(decorator: dict, count: int) -> list:
     Returns:
         list: List of CSS documents that apply to current usage of decorator.
     """
-    stylesheets = [decorator['css']]
+    return [decorator[key] for key in get_decorator_stylesheet_keys(decorator, count)]
+
+def get_decorator_stylesheet_keys(decorator: dict, count: int) -> list:
+    """
+    Gets the keys of the stylesheets that apply to a decorator on a page.
+
+    Args:
+        decorator (dict): Decorator config object.
+        count (int): Current page count.
+
+    Returns:
+        list: List of keys of decorator, out of 'css', 'evenCss' and 'oddCss'.
+    """
+    keys = ['css']
     if 'evenCss' in decorator and count % 2 == 0:
-        stylesheets.append(decorator['evenCss'])
+        keys.append('evenCss')
     elif 'oddCss' in decorator and count % 2 != 0:
-        stylesheets.append(decorator['oddCss'])
-    return stylesheets
+        keys.append('oddCss')
+    return keys
 
 def process_decorator_template(template: str, count: int, variables: dict) -> str:
     """
@@ -146,8 +617,20 @@ def process_decorator_template(template: str, count: int, variables: dict) -> st
         str: Interpolated template output.
     """
     variables['pageNumber'] = count
-    template_object = jinja2.Template(template)
-    return template_object.render(variables)
+    return get_decorator_template(template).render(variables)
+
+@lru_cache(maxsize=DECORATOR_TEMPLATE_CACHE_SIZE)
+def get_decorator_template(template: str) -> jinja2.Template:
+    """
+    Compiles a decorator template, reusing the compiled template for every page that uses it.
+
+    Args:
+        template (str): Base template to use.
+
+    Returns:
+        jinja2.Template: Compiled template.
+    """
+    return jinja2.Template(template)
 
 def get_element(boxes: any, element: str) -> any:
     """
@@ -0,0 +1,528 @@
+"""
+HTML preview functions for libris.
+
+A preview writes each source as a static HTML page that links its stylesheets and includes its
+decorators, skipping Weasyprint layout entirely. It is meant for copy editing in a browser. In
+watch mode, a preview cache keeps the converted HTML of every markdown file and split chunk, so
+that a rebuild only reads, pipes and converts the files that changed.
+"""
+import hashlib
+import html
+import json
+import os
+from pathlib import Path
+from typing import Callable, Union
+import jinja2
+from .data_extractors import (
+    add_source_dependencies, get_markdown_file_list, get_markdown_from_file, get_stylesheet_files,
+    get_variants, join_markdown
+)
+from .dependencies import DependencyGraph
+from .html_processing import get_html_processor
+from .manifest import get_file_hash
+from .markdown_engines import get_markdown_engine
+from .splitting import split_markdown
+
+PREVIEW_DIRECTORY_SUFFIX = '-preview'
+PREVIEW_PAGE_NUMBER = '#'
+PREVIEW_SETTINGS = ['markdownEngine', 'markdownPipe', 'documentWrapperClass', 'htmlTransforms']
+
+class PreviewCache:
+    """
+    Holds the HTML converted by earlier previews, keyed by the hashes of the markdown it was
+    converted from. The cache is cleared when settings that affect every source change, and
+    entries that a preview did not use are dropped at its end.
+    """
+    def __init__(self):
+        self.settings_key = None
+        self.entries = {}
+        self.used_keys = set()
+
+    def start(self, settings_key: str):
+        """
+        Starts a preview.
+
+        Args:
+            settings_key (str): Serialized settings that affect the HTML of every source.
+        """
+        if settings_key != self.settings_key:
+            self.settings_key = settings_key
+            self.entries = {}
+        self.used_keys = set()
+
+    def get(self, key: tuple, create: Callable[[], any]) -> any:
+        """
+        Gets a cached entry, creating it if the cache does not have it.
+
+        Args:
+            key (tuple): Key of the entry.
+            create (Callable[[], any]): Function that creates the entry.
+
+        Returns:
+            any: The entry.
+        """
+        self.used_keys.add(key)
+        if key not in self.entries:
+            self.entries[key] = create()
+        return self.entries[key]
+
+    def keep(self, keys: list):
+        """
+        Keeps entries that the current preview used without getting them.
+
+        Args:
+            keys (list): Keys of the entries.
+        """
+        self.used_keys.update(keys)
+
+    def finish(self):
+        """
+        Ends a preview, dropping the entries it did not use.
+        """
+        self.entries = {
+            key: value for key, value in self.entries.items() if key in self.used_keys
+        }
+
+def build_preview(
+        config: dict,
+        be_verbose: bool,
+        preview_cache: PreviewCache
+    ) -> DependencyGraph:
+    """
+    Builds an HTML preview of each variant next to its PDF output path. Only pages whose content
+    changed are rewritten.
+
+    Args:
+        config (dict): Configuration data to use for the preview.
+        be_verbose (bool): Whether to print additional debugging information.
+        preview_cache (PreviewCache): HTML converted by earlier previews. Updated in place.
+
+    Returns:
+        DependencyGraph: Every file read during the build.
+    """
+    dependencies = DependencyGraph()
+    html_sections = get_preview_html_sections(config, preview_cache, dependencies)
+    for variant in get_variants(config):
+        write_preview_variant(config, variant, html_sections, dependencies, be_verbose)
+    return dependencies
+
+def write_preview_variant(
+        config: dict,
+        variant: dict,
+        html_sections: list,
+        dependencies: DependencyGraph,
+        be_verbose: bool
+    ):
+    """
+    Writes the preview pages and contents page of one variant.
+
+    Args:
+        config (dict): Configuration data to use for the preview.
+        variant (dict): Variant from get_variants.
+        html_sections (list): HTML string for each source.
+        dependencies (DependencyGraph): Graph in which to record files read.
+        be_verbose (bool): Whether to print additional debugging information.
+    """
+    directory = get_preview_directory(variant['output'])
+    os.makedirs(directory, exist_ok=True)
+    page_paths = [
+        os.path.join(directory, f'section-{index}.html') for index in range(len(html_sections))
+    ]
+    for index, html_section in enumerate(html_sections):
+        source = config['sources'][index]
+        source_config = source if isinstance(source, dict) else {}
+        style = variant['styles'].get(
+            source_config.get('style', variant['defaultStyle']),
+            variant['styles'].get(variant['defaultStyle'])
+        )
+        page = get_preview_page(
+            html_section,
+            get_preview_stylesheet_files(style, dependencies),
+            get_decorator_html(style, source_config.get('variables', {}), dependencies),
+            page_paths,
+            index
+        )
+        write_if_changed(page_paths[index], page, be_verbose)
+    index_page = get_preview_index_page(page_paths)
+    write_if_changed(os.path.join(directory, 'index.html'), index_page, be_verbose)
+
+def get_preview_html_sections(
+        config: dict,
+        preview_cache: PreviewCache,
+        dependencies: DependencyGraph
+    ) -> list:
+    """
+    Converts each source to HTML, reusing the HTML of every markdown file and split chunk that has
+    not changed since the last preview.
+
+    Args:
+        config (dict): Configuration data to use for the preview.
+        preview_cache (PreviewCache): HTML converted by earlier previews. Updated in place.
+        dependencies (DependencyGraph): Graph in which to record files read.
+
+    Returns:
+        list: HTML string for each source.
+    """
+    process_html = start_preview(config, preview_cache, dependencies)
+    output = []
+    for item in config['sources']:
+        add_source_dependencies(item, dependencies)
+        output.append(get_preview_source_html(item, config, process_html, preview_cache))
+    preview_cache.finish()
+    return output
+
+def start_preview(
+        config: dict,
+        preview_cache: PreviewCache,
+        dependencies: DependencyGraph
+    ) -> Callable[[str], str]:
+    """
+    Creates the HTML post-processing function and starts the preview cache. The cache is cleared
+    when a setting in PREVIEW_SETTINGS or a custom transform module changes.
+
+    Args:
+        config (dict): Configuration data to use for the preview.
+        preview_cache (PreviewCache): HTML converted by earlier previews.
+        dependencies (DependencyGraph): Graph in which to record files read.
+
+    Returns:
+        Callable[[str], str]: Function that post-processes a source's HTML.
+    """
+    transform_dependencies = DependencyGraph()
+    process_html = get_html_processor(
+        config.get('documentWrapperClass'),
+        config.get('htmlTransforms', []),
+        transform_dependencies
+    )
+    settings = [config.get(setting) for setting in PREVIEW_SETTINGS]
+    for file_path in sorted(transform_dependencies.files):
+        dependencies.add_file(file_path)
+        settings.append(get_file_hash(file_path))
+    preview_cache.start(json.dumps(settings, sort_keys=True))
+    return process_html
+
+def get_preview_source_html(
+        item: Union[dict, str],
+        config: dict,
+        process_html: Callable[[str], str],
+        preview_cache: PreviewCache
+    ) -> str:
+    """
+    Converts one source to HTML. A source whose markdown files have not changed is not converted
+    or post-processed again.
+
+    Args:
+        item (Union[dict, str]): Source configuration dictionary or string.
+        config (dict): Configuration data to use for the preview.
+        process_html (Callable[[str], str]): HTML post-processing function.
+        preview_cache (PreviewCache): HTML converted by earlier previews.
+
+    Returns:
+        str: HTML of the source.
+    """
+    file_keys = tuple(
+        (filename, get_file_hash(filename)) for filename in get_markdown_file_list(item)
+    )
+    source_key = ('source', json.dumps(item, sort_keys=True), file_keys)
+    html_section, part_keys = preview_cache.get(
+        source_key,
+        lambda: convert_preview_source(item, file_keys, config, process_html, preview_cache)
+    )
+    preview_cache.keep(part_keys)
+    return html_section
+
+def convert_preview_source(
+        item: Union[dict, str],
+        file_keys: tuple,
+        config: dict,
+        process_html: Callable[[str], str],
+        preview_cache: PreviewCache
+    ) -> 'tuple[str, list]':
+    """
+    Converts one source to HTML from the cached HTML of its unchanged files or chunks, and
+    post-processes the whole source.
+
+    Args:
+        item (Union[dict, str]): Source configuration dictionary or string.
+        file_keys (tuple): Path and hash of each of the source's markdown files.
+        config (dict): Configuration data to use for the preview.
+        process_html (Callable[[str], str]): HTML post-processing function.
+        preview_cache (PreviewCache): HTML converted by earlier previews.
+
+    Returns:
+        str: HTML of the source.
+        list: Cache keys of the files or chunks the HTML was converted from.
+    """
+    if isinstance(item, dict) and 'split' in item:
+        parts, part_keys = convert_preview_chunks(item['split'], file_keys, config, preview_cache)
+    else:
+        parts, part_keys = convert_preview_files(file_keys, config, preview_cache)
+    return process_html('\n'.join(parts)), part_keys
+
+def convert_preview_files(
+        file_keys: tuple,
+        config: dict,
+        preview_cache: PreviewCache
+    ) -> 'tuple[list, list]':
+    """
+    Converts each markdown file of a source on its own, reading and piping only the files whose
+    hashes are not in the cache.
+
+    Args:
+        file_keys (tuple): Path and hash of each of the source's markdown files.
+        config (dict): Configuration data to use for the preview.
+        preview_cache (PreviewCache): HTML converted by earlier previews.
+
+    Returns:
+        list: HTML of each file.
+        list: Cache keys of the files.
+    """
+    convert_markdown = get_markdown_engine(config.get('markdownEngine'))
+    markdown_pipe = config.get('markdownPipe')
+    part_keys = [('html', filename, file_hash) for filename, file_hash in file_keys]
+    parts = [
+        preview_cache.get(
+            part_key,
+            lambda filename=part_key[1]: convert_markdown(
+                get_markdown_from_file(filename, markdown_pipe)
+            )
+        ) for part_key in part_keys
+    ]
+    return parts, part_keys
+
+def convert_preview_chunks(
+        split: dict,
+        file_keys: tuple,
+        config: dict,
+        preview_cache: PreviewCache
+    ) -> 'tuple[list, list]':
+    """
+    Splits a source the way a PDF build does and converts each chunk, reading and piping only the
+    files whose hashes are not in the cache and converting only the chunks whose text is not.
+    Marker lines are removed by the split.
+
+    Args:
+        split (dict): Split settings of the source.
+        file_keys (tuple): Path and hash of each of the source's markdown files.
+        config (dict): Configuration data to use for the preview.
+        preview_cache (PreviewCache): HTML converted by earlier previews.
+
+    Returns:
+        list: HTML of each chunk.
+        list: Cache keys of the files and chunks.
+    """
+    markdown_pipe = config.get('markdownPipe')
+    part_keys = [('markdown', filename, file_hash) for filename, file_hash in file_keys]
+    texts = [
+        preview_cache.get(
+            part_key,
+            lambda filename=part_key[1]: get_markdown_from_file(filename, markdown_pipe)
+        ) for part_key in part_keys
+    ]
+    chunks = split_markdown(join_markdown(texts), split.get('headingLevel'), split.get('marker'))
+    convert_markdown = get_markdown_engine(config.get('markdownEngine'))
+    parts = []
+    for chunk in chunks:
+        part_key = ('chunk', hashlib.sha256(chunk.encode('utf-8')).hexdigest())
+        parts.append(preview_cache.get(part_key, lambda chunk=chunk: convert_markdown(chunk)))
+        part_keys.append(part_key)
+    return parts, part_keys
+
+def get_preview_stylesheet_files(style: any, dependencies: DependencyGraph) -> list:
+    """
+    Lists the stylesheet files of a schema-defined style and records them as dependencies.
+
+    Args:
+        style (any): Style definition string, list or object, or None.
+        dependencies (DependencyGraph): Graph in which to record files read.
+
+    Returns:
+        list: List of stylesheet paths.
+    """
+    output = get_stylesheet_files(style)
+    for stylesheet in output:
+        dependencies.add_file(stylesheet)
+    return output
+
+def get_decorator_html(style: any, variables: dict, dependencies: DependencyGraph) -> list:
+    """
+    Renders the decorator templates of a schema-defined style.
+
+    Args:
+        style (any): Style definition string, list or object, or None.
+        variables (dict): Variables to be applied to the decorators.
+        dependencies (DependencyGraph): Graph in which to record files read.
+
+    Returns:
+        list: List of dictionaries with 'html' and 'stylesheets' keys, one per decorator.
+    """
+    if not isinstance(style, dict):
+        return []
+    decorators = style.get('decorators', [style['decorator']] if 'decorator' in style else [])
+    return [
+        render_preview_decorator(decorator, variables, dependencies) for decorator in decorators
+    ]
+
+def render_preview_decorator(
+        decorator: dict,
+        variables: dict,
+        dependencies: DependencyGraph
+    ) -> dict:
+    """
+    Renders one decorator template. Page numbers are not known without layout, so the pageNumber
+    variable is replaced with a placeholder and the odd page stylesheet is used.
+
+    Args:
+        decorator (dict): Schema-defined decorator object.
+        variables (dict): Variables to be applied to the decorator.
+        dependencies (DependencyGraph): Graph in which to record files read.
+
+    Returns:
+        dict: Dictionary with 'html' and 'stylesheets' keys.
+    """
+    dependencies.add_file(decorator['template'])
+    with open(decorator['template'], 'r', encoding='utf-8') as template_file:
+        template_object = jinja2.Template(template_file.read())
+    stylesheets = [decorator['stylesheet']]
+    if 'oddStylesheet' in decorator:
+        stylesheets.append(decorator['oddStylesheet'])
+    for stylesheet in stylesheets:
+        dependencies.add_file(stylesheet)
+    return {
+        'html': template_object.render(dict(variables, pageNumber=PREVIEW_PAGE_NUMBER)),
+        'stylesheets': stylesheets
+    }
+
+def get_preview_page(
+        html_section: str,
+        stylesheets: list,
+        decorators: list,
+        page_paths: list,
+        index: int
+    ) -> str:
+    """
+    Builds the HTML page for one source. Relative links in the content and stylesheets resolve
+    against the working directory, as they do in a PDF build.
+
+    Args:
+        html_section (str): Converted HTML for the source.
+        stylesheets (list): Stylesheet paths for the source's style.
+        decorators (list): Rendered decorators from get_decorator_html.
+        page_paths (list): Paths of every preview page, for navigation links.
+        index (int): Index of the source.
+
+    Returns:
+        str: Complete HTML page.
+    """
+    all_stylesheets = list(stylesheets)
+    for decorator in decorators:
+        all_stylesheets += decorator['stylesheets']
+    links = []
+    for stylesheet in all_stylesheets:
+        links.append(f'<link rel="stylesheet" href="{html.escape(stylesheet)}">')
+    navigation = []
+    if index > 0:
+        navigation.append(f'<a href="{get_file_uri(page_paths[index - 1])}">Previous</a>')
+    navigation.append(f'<a href="{get_file_uri(get_index_path(page_paths))}">Contents</a>')
+    if index < len(page_paths) - 1:
+        navigation.append(f'<a href="{get_file_uri(page_paths[index + 1])}">Next</a>')
+    return '\n'.join([
+        '<!DOCTYPE html>',
+        '<html>',
+        '<head>',
+        '<meta charset="utf-8">',
+        f'<title>Section {index + 1}</title>',
+        f'<base href="{Path(os.getcwd()).as_uri()}/">',
+        *links,
+        '</head>',
+        '<body>',
+        f'<nav class="libris-preview-navigation">{" ".join(navigation)}</nav>',
+        *[decorator['html'] for decorator in decorators],
+        html_section,
+        '</body>',
+        '</html>',
+        ''
+    ])
+
+def get_preview_index_page(page_paths: list) -> str:
+    """
+    Builds the contents page linking every source's preview page.
+
+    Args:
+        page_paths (list): Paths of every preview page.
+
+    Returns:
+        str: Complete HTML page.
+    """
+    items = []
+    for index, page_path in enumerate(page_paths):
+        items.append(f'<li><a href="{os.path.basename(page_path)}">Section {index + 1}</a></li>')
+    return '\n'.join([
+        '<!DOCTYPE html>',
+        '<html>',
+        '<head>',
+        '<meta charset="utf-8">',
+        '<title>Contents</title>',
+        '</head>',
+        '<body>',
+        '<ol>',
+        *items,
+        '</ol>',
+        '</body>',
+        '</html>',
+        ''
+    ])
+
+def get_preview_directory(output_file_path: str) -> str:
+    """
+    Gets the preview directory for a PDF output path.
+
+    Args:
+        output_file_path (str): Path of the PDF output.
+
+    Returns:
+        str: Path of the preview directory.
+    """
+    return os.path.splitext(output_file_path)[0] + PREVIEW_DIRECTORY_SUFFIX
+
+def get_index_path(page_paths: list) -> str:
+    """
+    Gets the contents page path for a list of preview pages.
+
+    Args:
+        page_paths (list): Paths of every preview page.
+
+    Returns:
+        str: Path of the contents page.
+    """
+    return os.path.join(os.path.dirname(page_paths[0]), 'index.html')
+
+def get_file_uri(file_path: str) -> str:
+    """
+    Converts a file path to an absolute file URI.
+
+    Args:
+        file_path (str): Path to convert.
+
+    Returns:
+        str: File URI.
+    """
+    return html.escape(Path(file_path).resolve().as_uri())
+
+def write_if_changed(file_path: str, content: str, be_verbose: bool):
+    """
+    Writes a file unless it already has the given content.
+
+    Args:
+        file_path (str): Path of the file.
+        content (str): Content to write.
+        be_verbose (bool): Whether to print additional debugging information.
+    """
+    if os.path.isfile(file_path):
+        with open(file_path, 'r', encoding='utf-8') as existing_file:
+            if existing_file.read() == content:
+                return
+    with open(file_path, 'w', encoding='utf-8') as output_file:
+        output_file.write(content)
+    if be_verbose:
+        print(f'Wrote {file_path}')
@@ -0,0 +1,381 @@
+"""
+Sharded build functions for libris.
+
+A sharded build splits the sources of a configuration between several processes or machines.
+Each shard renders its sections without decorators and writes an artifact directory to a shared
+directory. The merge step reads every artifact, works out the page number at which each section
+starts, overlays the decorators with the correct page numbers, and writes the final PDFs.
+"""
+import json
+import os
+from typing import Union
+from .build_context import BuildContext
+from .data_extractors import (
+    get_config_hash, get_css_data, get_decorator_data_from_styles_dict, get_html_data,
+    get_json_data, get_variants
+)
+from .html_processing import get_html_processor
+from .markdown_engines import get_markdown_engine
+from .pdf_builder import (
+    get_decorator_overlays, get_layout_key, get_page_count, get_pypdf, get_section_style,
+    overlay_decorators, render_section, write_sections
+)
+
+ARTIFACT_FILE_NAME = 'artifact.json'
+DEFAULT_VARIANT_NAME = 'default'
+
+def build_shard(
+        config: dict,
+        shard_index: int,
+        shard_count: int,
+        directory: str,
+        be_verbose: bool
+    ):
+    """
+    Renders the sections assigned to one shard and writes them to an artifact directory. Section
+    n belongs to shard n % shard_count. Any artifact file left by an earlier build is removed
+    first, so that a merge cannot mistake it for this build's finished shard.
+
+    Args:
+        config (dict): Configuration data to use for PDF generation.
+        shard_index (int): Index of this shard, from 0 to shard_count - 1.
+        shard_count (int): Total number of shards.
+        directory (str): Shared directory in which to write the artifact.
+        be_verbose (bool): Whether to print additional debugging information.
+    """
+    if shard_index < 0 or shard_index >= shard_count:
+        raise ValueError(f'Shard index must be between 0 and {shard_count - 1}.')
+    config_hash = get_config_hash(config)
+    artifact_directory = prepare_artifact_directory(directory, shard_index)
+    context = BuildContext(be_verbose)
+    html_data = get_shard_html_data(config, shard_index, shard_count, context)
+    sections = render_shard_sections(config, html_data, artifact_directory, context)
+    write_artifact(artifact_directory, {
+        'index': shard_index,
+        'count': shard_count,
+        'sourceCount': len(config['sources']),
+        'configHash': config_hash,
+        'sections': sections
+    })
+
+def prepare_artifact_directory(directory: str, shard_index: int) -> str:
+    """
+    Creates a shard's artifact directory and removes any artifact file from an earlier build.
+
+    Args:
+        directory (str): Shared directory for all shards.
+        shard_index (int): Index of the shard.
+
+    Returns:
+        str: Path to the shard's artifact directory.
+    """
+    artifact_directory = get_artifact_directory(directory, shard_index)
+    os.makedirs(artifact_directory, exist_ok=True)
+    artifact_path = os.path.join(artifact_directory, ARTIFACT_FILE_NAME)
+    if os.path.isfile(artifact_path):
+        os.remove(artifact_path)
+    return artifact_directory
+
+def get_shard_html_data(
+        config: dict,
+        shard_index: int,
+        shard_count: int,
+        context: BuildContext
+    ) -> dict:
+    """
+    Converts the sources assigned to a shard.
+
+    Args:
+        config (dict): Configuration data to use for PDF generation.
+        shard_index (int): Index of the shard.
+        shard_count (int): Total number of shards.
+        context (BuildContext): Build in which to record files read, and whose be_verbose
+            setting controls debugging output.
+
+    Returns:
+        dict: HTML data of each assigned source, as returned by get_html_data, keyed by section
+            index.
+    """
+    section_indices = list(range(shard_index, len(config['sources']), shard_count))
+    html_data = get_html_data(
+        [config['sources'][section_index] for section_index in section_indices],
+        get_html_processor(
+            config.get('documentWrapperClass'),
+            config.get('htmlTransforms', []),
+            context.dependencies
+        ),
+        config.get('markdownPipe', None),
+        get_markdown_engine(config.get('markdownEngine')),
+        context
+    )
+    return dict(zip(section_indices, html_data))
+
+def render_shard_sections(
+        config: dict,
+        html_data: dict,
+        artifact_directory: str,
+        context: BuildContext
+    ) -> list:
+    """
+    Renders a shard's sections for every variant, without decorators, to the artifact directory.
+
+    Args:
+        config (dict): Configuration data to use for PDF generation.
+        html_data (dict): HTML data of each assigned source, keyed by section index.
+        artifact_directory (str): The shard's artifact directory.
+        context (BuildContext): Build in which to record files read and cache CSS and layouts.
+
+    Returns:
+        list: Artifact section entries for the rendered sections.
+    """
+    output = []
+    for variant in get_variants(config):
+        variant_name = variant['name'] or DEFAULT_VARIANT_NAME
+        css_data = get_css_data(variant['styles'], context)
+        for section_index, html_config in html_data.items():
+            section_style = get_section_style(html_config, variant, css_data, {})
+            output.append(render_shard_section(
+                (variant_name, section_index),
+                html_config,
+                section_style,
+                artifact_directory,
+                context
+            ))
+    return output
+
+def render_shard_section(
+        section_key: tuple,
+        html_config: dict,
+        section_style: dict,
+        artifact_directory: str,
+        context: BuildContext
+    ) -> dict:
+    """
+    Renders one section of one variant, without decorators, to the artifact directory.
+
+    Args:
+        section_key (tuple): Variant name and index of the section in the sources list.
+        html_config (dict): HTML data of the source.
+        section_style (dict): Style of the section, from get_section_style, without decorators.
+        artifact_directory (str): The shard's artifact directory.
+        context (BuildContext): Build in which to record files read and cache layouts.
+
+    Returns:
+        dict: Artifact section entry.
+    """
+    variant_name, section_index = section_key
+    section = render_section(
+        html_config,
+        section_style,
+        1,
+        get_layout_key(section_index, section_style['css']),
+        context
+    )
+    file_name = f'{variant_name}-{section_index}.pdf'
+    write_sections([section], os.path.join(artifact_directory, file_name))
+    return {
+        'variant': variant_name,
+        'section': section_index,
+        'file': file_name,
+        'pageCount': get_page_count(section)
+    }
+
+def merge_shards(config: dict, directory: str):
+    """
+    Combines the artifacts written by every shard into the final PDFs, applying decorators with
+    page numbers computed from the page counts the shards published.
+
+    Args:
+        config (dict): Configuration data used to build the shards.
+        directory (str): Shared directory containing the shard artifacts.
+    """
+    get_pypdf('Merging shards')
+    artifacts = read_artifacts(directory, get_config_hash(config))
+    sections = get_sections(config, artifacts)
+    context = BuildContext()
+    for variant in get_variants(config):
+        merge_variant(config, variant, sections, context)
+
+def merge_variant(config: dict, variant: dict, sections: dict, context: BuildContext):
+    """
+    Combines the section PDFs of one variant into its final PDF, applying decorators. The
+    decorators of every page of the variant are rendered together in worker processes.
+
+    Args:
+        config (dict): Configuration data used to build the shards.
+        variant (dict): Variant returned by get_variants.
+        sections (dict): Section PDFs and page counts returned by get_sections.
+        context (BuildContext): Merge in which to record files read and cache CSS objects.
+    """
+    decorator_data = get_decorator_data_from_styles_dict(variant['styles'], context)
+    readers = []
+    overlays = []
+    count = 1
+    for section_index, source in enumerate(config['sources']):
+        reader = read_section(sections[(variant['name'] or DEFAULT_VARIANT_NAME, section_index)])
+        overlays += get_source_overlays(reader, source, variant, decorator_data, count)
+        readers.append(reader)
+        count += len(reader.pages)
+    overlay_decorators(overlays, context.dependencies)
+    write_sections([readers], variant['output'])
+
+def read_section(section: dict) -> any:
+    """
+    Opens a section PDF and checks it against the page count published in its artifact.
+
+    Args:
+        section (dict): Section entry returned by get_sections.
+
+    Returns:
+        PdfReader: pypdf reader for the section PDF.
+    """
+    reader = get_pypdf('Merging shards').PdfReader(section['path'])
+    if len(reader.pages) != section['pageCount']:
+        raise ValueError(f'Section PDF {section["path"]} does not match its artifact.')
+    return reader
+
+def get_source_overlays(
+        reader: any,
+        source: Union[dict, str],
+        variant: dict,
+        decorator_data: dict,
+        count: int
+    ) -> list:
+    """
+    Lists the decorators of a source's style to draw over every page of its section PDF.
+
+    Args:
+        reader (PdfReader): pypdf reader for the section PDF.
+        source (Union[dict, str]): Source configuration dictionary or string.
+        variant (dict): Variant returned by get_variants.
+        decorator_data (dict): Decorators for each of the variant's styles.
+        count (int): Page number of the section's first page.
+
+    Returns:
+        list: Overlays returned by get_decorator_overlays.
+    """
+    source_config = source if isinstance(source, dict) else {}
+    return get_decorator_overlays(
+        reader,
+        get_section_style(source_config, variant, {}, decorator_data)['decorators'],
+        count,
+        source_config.get('variables', {})
+    )
+
+def get_artifact_directory(directory: str, shard_index: int) -> str:
+    """
+    Gets the artifact directory of a shard.
+
+    Args:
+        directory (str): Shared directory for all shards.
+        shard_index (int): Index of the shard.
+
+    Returns:
+        str: Path to the shard's artifact directory.
+    """
+    return os.path.join(directory, f'shard-{shard_index}')
+
+def write_artifact(artifact_directory: str, artifact: dict):
+    """
+    Writes a shard's artifact file. The file is written last and atomically, so its presence means
+    the shard's section PDFs are complete.
+
+    Args:
+        artifact_directory (str): The shard's artifact directory.
+        artifact (dict): Artifact data.
+    """
+    artifact_path = os.path.join(artifact_directory, ARTIFACT_FILE_NAME)
+    temporary_path = artifact_path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as artifact_file:
+        json.dump(artifact, artifact_file, indent=4)
+    os.replace(temporary_path, artifact_path)
+
+def read_artifacts(directory: str, config_hash: str) -> list:
+    """
+    Reads the artifacts of every shard and checks that they form one complete build of the
+    given configuration.
+
+    Args:
+        directory (str): Shared directory containing the shard artifacts.
+        config_hash (str): Hash of the configuration being merged, from get_config_hash.
+
+    Returns:
+        list: List of artifact dictionaries, ordered by shard index, each with an added
+            'directory' key.
+    """
+    first_artifact = read_artifact(get_artifact_directory(directory, 0))
+    if first_artifact is None:
+        raise ValueError(f'No shard artifacts found in {directory}.')
+    output = []
+    for shard_index in range(first_artifact['count']):
+        artifact_directory = get_artifact_directory(directory, shard_index)
+        artifact = read_artifact(artifact_directory)
+        check_artifact(artifact, shard_index, first_artifact['count'], config_hash)
+        artifact['directory'] = artifact_directory
+        output.append(artifact)
+    return output
+
+def check_artifact(
+        artifact: Union[dict, None],
+        shard_index: int,
+        shard_count: int,
+        config_hash: str
+    ):
+    """
+    Checks that a shard has finished building the configuration being merged.
+
+    Args:
+        artifact (Union[dict, None]): Artifact data returned by read_artifact.
+        shard_index (int): Index of the shard.
+        shard_count (int): Number of shards published by the first shard.
+        config_hash (str): Hash of the configuration being merged, from get_config_hash.
+    """
+    if artifact is None:
+        raise ValueError(f'Shard {shard_index} has not finished.')
+    if artifact['count'] != shard_count or artifact.get('configHash') != config_hash:
+        raise ValueError(f'Shard {shard_index} was built with a different configuration.')
+
+def read_artifact(artifact_directory: str) -> Union[dict, None]:
+    """
+    Reads a shard's artifact file.
+
+    Args:
+        artifact_directory (str): The shard's artifact directory.
+
+    Returns:
+        Union[dict, None]: Artifact data, or None if the shard has not finished.
+    """
+    artifact_path = os.path.join(artifact_directory, ARTIFACT_FILE_NAME)
+    if not os.path.isfile(artifact_path):
+        return None
+    return get_json_data(artifact_path)
+
+def get_sections(config: dict, artifacts: list) -> dict:
+    """
+    Maps every variant and section of the configuration to its rendered section PDF and the page
+    count published for it.
+
+    Args:
+        config (dict): Configuration data used to build the shards.
+        artifacts (list): Artifact dictionaries returned by read_artifacts.
+
+    Returns:
+        dict: Dictionary of dictionaries with 'path' and 'pageCount' keys, keyed by
+            (variant name, section index).
+    """
+    output = {}
+    for artifact in artifacts:
+        for section in artifact['sections']:
+            key = (section['variant'], section['section'])
+            output[key] = {
+                'path': os.path.join(artifact['directory'], section['file']),
+                'pageCount': section['pageCount']
+            }
+    for variant in get_variants(config):
+        variant_name = variant['name'] or DEFAULT_VARIANT_NAME
+        for section_index in range(len(config['sources'])):
+            if (variant_name, section_index) not in output:
+                raise ValueError(
+                    f'No shard rendered section {section_index} of variant {variant_name}.'
+                )
+    return output
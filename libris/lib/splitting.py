@@ -0,0 +1,137 @@
+"""
+Markdown splitting functions for libris.
+"""
+import re
+from typing import Union
+
+HEADING_PATTERN = re.compile(r'^ {0,3}(#{1,6})(\s|$)')
+FENCE_PATTERN = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+DEFINITION_PATTERN = re.compile(r'^ {0,3}\[([^\]]+)\]:')
+REFERENCE_PATTERN = re.compile(r'\[([^\]]+)\](?:\[([^\]]*)\])?')
+
+def split_markdown(
+        markdown_text: str,
+        heading_level: Union[int, None],
+        marker: Union[str, None]
+    ) -> list:
+    """
+    Splits Markdown into chunks before headings of the given level or higher and at lines that
+    consist only of the marker. Marker lines are removed. Fenced code blocks are never split.
+
+    Args:
+        markdown_text (str): Markdown text to split.
+        heading_level (Union[int, None]): Deepest ATX heading level to split before, or None.
+        marker (Union[str, None]): Explicit split marker line, or None.
+
+    Returns:
+        list: List of non-empty Markdown chunks, in order. Always contains at least one chunk.
+    """
+    chunks = [[]]
+    fence = None
+    for line in markdown_text.splitlines(keepends=True):
+        if fence is None and marker is not None and line.strip() == marker:
+            chunks.append([])
+        elif fence is None and is_split_heading(line, heading_level):
+            chunks.append([line])
+        else:
+            chunks[-1].append(line)
+        fence = get_fence_state(line, fence)
+    output = [''.join(lines) for lines in chunks]
+    return [chunk for chunk in output if chunk.strip()] or [markdown_text]
+
+def is_split_heading(line: str, heading_level: Union[int, None]) -> bool:
+    """
+    Checks whether a line is an ATX heading at which to split.
+
+    Args:
+        line (str): Line of Markdown.
+        heading_level (Union[int, None]): Deepest heading level to split before, or None.
+
+    Returns:
+        bool: Whether to split before the line.
+    """
+    if heading_level is None:
+        return False
+    match = HEADING_PATTERN.match(line)
+    return match is not None and len(match.group(1)) <= heading_level
+
+def get_fence_state(line: str, fence: Union[str, None]) -> Union[str, None]:
+    """
+    Tracks whether the lines being read are inside a fenced code block.
+
+    Args:
+        line (str): Line of Markdown.
+        fence (Union[str, None]): Opening fence of the current code block, or None if outside
+            of a code block.
+
+    Returns:
+        Union[str, None]: Opening fence of the code block after this line, or None.
+    """
+    match = FENCE_PATTERN.match(line)
+    if match is None:
+        return fence
+    if fence is None:
+        return match.group(1)
+    if match.group(1)[0] == fence[0] and len(match.group(1)) >= len(fence):
+        if not line.strip().strip(fence[0]):
+            return None
+    return fence
+
+def get_cross_chunk_references(chunks: list) -> list:
+    """
+    Lists reference-style link labels used in one chunk but only defined in another. Chunks are
+    converted separately, so such links are left as literal text.
+
+    Args:
+        chunks (list): Markdown chunks returned by split_markdown.
+
+    Returns:
+        list: Sorted list of normalized labels.
+    """
+    chunk_labels = [get_chunk_labels(chunk) for chunk in chunks]
+    all_definitions = set()
+    for definitions, _ in chunk_labels:
+        all_definitions |= definitions
+    output = set()
+    for definitions, references in chunk_labels:
+        output |= (references - definitions) & all_definitions
+    return sorted(output)
+
+def get_chunk_labels(chunk: str) -> 'tuple[set, set]':
+    """
+    Finds the link reference definitions in a Markdown chunk and the labels it references.
+    Fenced code blocks are ignored.
+
+    Args:
+        chunk (str): Markdown chunk.
+
+    Returns:
+        set: Normalized labels defined in the chunk.
+        set: Normalized labels that may be references, including shortcut references.
+    """
+    definitions = set()
+    references = set()
+    fence = None
+    for line in chunk.splitlines():
+        if fence is None:
+            definition = DEFINITION_PATTERN.match(line)
+            if definition is not None:
+                definitions.add(normalize_label(definition.group(1)))
+            else:
+                for match in REFERENCE_PATTERN.finditer(line):
+                    references.add(normalize_label(match.group(2) or match.group(1)))
+        fence = get_fence_state(line, fence)
+    return definitions, references
+
+def normalize_label(label: str) -> str:
+    """
+    Normalizes a link label the way Markdown matches labels: case-insensitively, with runs of
+    whitespace collapsed.
+
+    Args:
+        label (str): Link label.
+
+    Returns:
+        str: Normalized label.
+    """
+    return ' '.join(label.lower().split())
@@ -1,43 +1,90 @@
 """
 Watch functionality for libris.
 """
-import os
 import time
-from watchdog.events import FileSystemEventHandler
+from typing import Union
+from watchdog.events import FileSystemEvent, FileSystemEventHandler
 from watchdog.observers import Observer
 from .data_extractors import get_json_data
+from .dependencies import DependencyGraph
 from .pdf_builder import build_pdf
+from .preview import PreviewCache, build_preview
 
 class WatchEventHandler(FileSystemEventHandler):
     """
-    Event handler for the watch function.
+    Event handler for the watch function. Only rebuilds for changes to files the last build read.
+    Builds an HTML preview instead of a PDF when given a preview cache.
     """
-    def __init__(self, config_path: str, be_verbose: bool):
+    def __init__(
+            self,
+            config_path: str,
+            be_verbose: bool,
+            dependencies: DependencyGraph,
+            preview_cache: Union[PreviewCache, None]
+        ):
         self.config_path = config_path
         self.be_verbose = be_verbose
+        self.dependencies = dependencies
+        self.preview_cache = preview_cache
+        self.dependencies.add_file(config_path)
         super().__init__()
 
-    def on_any_event(self, event):
+    def on_any_event(self, event: FileSystemEvent):
         """
         Runs on any file event in the watched directories.
         """
+        if not is_relevant_event(event, self.dependencies):
+            return
         print('Files changed, recompiling...')
         config = get_json_data(self.config_path)
-        build_pdf(config, self.be_verbose)
+        if self.preview_cache is None:
+            dependencies = build_pdf(config, self.be_verbose, False)
+        else:
+            dependencies = build_preview(config, self.be_verbose, self.preview_cache)
+        dependencies.add_file(self.config_path)
+        self.dependencies = dependencies
 
-def watch(config_file_path: str, be_verbose: bool):
+def is_relevant_event(event: FileSystemEvent, dependencies: DependencyGraph) -> bool:
     """
-    Watches the config file and all referenced files and re-builds the PDF whenever they change.
+    Checks whether a file system event touches a file the build depends on.
+
+    Args:
+        event (FileSystemEvent): The file system event.
+        dependencies (DependencyGraph): Files read by the last build.
+
+    Returns:
+        bool: Whether the event should trigger a rebuild.
+    """
+    if event.is_directory:
+        return False
+    if dependencies.is_affected_by(event.src_path):
+        return True
+    dest_path = getattr(event, 'dest_path', None)
+    return bool(dest_path) and dependencies.is_affected_by(dest_path)
+
+def watch(
+        config_file_path: str,
+        be_verbose: bool,
+        dependencies: DependencyGraph,
+        preview_cache: Union[PreviewCache, None]
+    ):
+    """
+    Watches the config file and all files read by the build and re-builds the PDF, or the HTML
+    preview, whenever they change.
 
     Args:
         config_file_path (str): The configuration file path.
         be_verbose (bool): Whether to print debugging information.
+        dependencies (DependencyGraph): Files read by the initial build.
+        preview_cache (Union[PreviewCache, None]): Cache from the initial preview build, or None
+            to build PDFs.
     """
     observer = Observer()
-    handler = WatchEventHandler(config_file_path, be_verbose)
+    handler = WatchEventHandler(config_file_path, be_verbose, dependencies, preview_cache)
+    directory_list = []
     try:
         while True:
-            observer = watch_loop_iteration(observer, handler, config_file_path)
+            observer, directory_list = watch_loop_iteration(observer, handler, directory_list)
     finally:
         observer.stop()
         observer.join()
@@ -45,92 +92,28 @@ def watch(config_file_path: str, be_verbose: bool):
 def watch_loop_iteration(
         observer: Observer,
         handler: WatchEventHandler,
-        config_file_path: str
-    ) -> Observer:
+        directory_list: list
+    ) -> 'tuple[Observer, list]':
     """
-    A single iteration of the watch loop.
+    A single iteration of the watch loop. The observer is only rebuilt when the set of watched
+    directories changes.
 
     Args:
         observer (Observer): Last constructed file system observer.
         handler (WatchEventHandler): Event handler for file system changes.
-        config_file_path (str): The path to the configuration file. 
-    """
-    file_list = build_watch_file_list(config_file_path)
-    directory_list = convert_file_list_to_directories(file_list)
-    observer.unschedule_all()
-    observer.stop()
-    observer = Observer()
-    for watched_directory in directory_list:
-        observer.schedule(handler, watched_directory)
-    observer.start()
-    time.sleep(1)
-    return observer
-
-
-def build_watch_file_list(config_file_path: str) -> list:
-    """
-    Creates a list of files to watch from the configuration file.
-
-    Args:
-        config_file_path (str): The path to the configuration file.
+        directory_list (list): Directories currently watched by the observer.
 
     Returns:
-        list: A list of filenames to be watched.
+        Observer: The current file system observer.
+        list: Directories watched by the current observer.
     """
-    config = get_json_data(config_file_path)
-    file_list = [config_file_path]
-    add_string_or_string_collection_if_present(file_list, config['sources'], ['source'])
-    if 'styles' in config:
-        for key in config['styles']:
-            value = config['styles'][key]
-            add_string_or_string_collection_if_present(
-                file_list,
-                value,
-                [
-                    'stylesheet',
-                    'stylesheets',
-                    'decorator',
-                    'template',
-                    'oddStylesheet',
-                    'evenStylesheet',
-                    'decorators'
-                ]
-            )
-    return file_list
-
-def add_string_or_string_collection_if_present(list_to_add_to: list, item: any, subkeys: list):
-    """
-    Recursively adds a string or collection of strings (or collection of collections of strings,
-    etc.) to a list. Only checks specified subkeys.
-
-    Args:
-        list_to_add_to (list): The list to which to append located strings.
-        item (any): The object to check. Objects other than strings, dictionaries, and lists will
-            not be processed.
-        subkeys (list): List of strings which are the keys to check in located dictionaries.
-    """
-    if isinstance(item, str):
-        list_to_add_to.append(item)
-    elif isinstance(item, dict):
-        for subkey in subkeys:
-            if subkey in item:
-                add_string_or_string_collection_if_present(list_to_add_to, item[subkey], subkeys)
-    elif isinstance(item, list):
-        for subitem in item:
-            add_string_or_string_collection_if_present(list_to_add_to, subitem, subkeys)
-
-def convert_file_list_to_directories(file_list: list) -> list:
-    """
-    Takes a list of relative file paths and converts to absolute directory paths, making sure all
-    results are unique.
-
-    Args:
-        file_list (list): List of relative file paths to process.
-
-    Returns:
-        list: List of unique absolute directory paths containing all files from file_list.
-    """
-    output = []
-    for filename in file_list:
-        output.append(os.path.dirname(os.path.abspath(filename)))
-    return list(set(output))
+    new_directory_list = handler.dependencies.get_watched_directories()
+    if new_directory_list != directory_list:
+        observer.unschedule_all()
+        observer.stop()
+        observer = Observer()
+        for watched_directory in new_directory_list:
+            observer.schedule(handler, watched_directory)
+        observer.start()
+    time.sleep(1)
+    return observer, new_directory_list
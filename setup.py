@@ -1,7 +1,18 @@
+import os
+import re
 from setuptools import setup
+
+CONSTANTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'libris/lib/constants.py')
+with open(CONSTANTS_PATH, 'r', encoding='utf-8') as constants_file:
+    VERSION = re.search(
+        r"^LIBRIS_VERSION = '([^']+)'$",
+        constants_file.read(),
+        re.MULTILINE
+    ).group(1)
+
 setup(
     name='libris',
-    version='1.4.0',
+    version=VERSION,
     description='PDF generator that uses Markdown sources.',
     url='https://github.com/lazy-scrivener-games/libris',
     download_url='https://github.com/lazy-scrivener-games/libris/archive/refs/tags/v1.1.tar.gz',
@@ -29,7 +40,6 @@ setup(
         'scripts/libris'
     ],
     install_requires=[
-        'beautifulsoup4 == 4.10.0',
         'idna == 2.6',
         'Jinja2 == 3.0.2',
         'jsonpointer == 1.10',
@@ -38,6 +48,10 @@ setup(
         'watchdog == 2.1.6',
         'weasyprint == 52.5'
     ],
+    extras_require={
+        'cmarkgfm': ['cmarkgfm >= 0.5.0'],
+        'merge': ['pypdf >= 3.0.0']
+    },
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'Intended Audience :: End Users/Desktop',